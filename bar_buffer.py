@@ -0,0 +1,59 @@
+import numpy as np
+
+# Bar fields kept per symbol, in storage order
+BAR_FIELDS = ('close', 'volume', 'high', 'low')
+
+class BarRingBuffer:
+    """Fixed-capacity OHLCV history for one symbol stored in a single contiguous NumPy block.
+    Every bar is written twice (at i and i + capacity), so the last `capacity` bars are always one
+    contiguous slice and the ordered views handed to indicator code never need a copy."""
+
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self._data = np.zeros((len(BAR_FIELDS), 2 * capacity), dtype=dtype)  # One row per field
+        self._next = 0  # Slot the next bar is written to
+        self._size = 0
+
+    def append(self, close, volume, high, low):
+        # Adds a bar, overwriting the oldest one once the buffer is full. O(1), no allocation.
+        slot = self._next
+        bar = (close, volume, high, low)
+        self._data[:, slot] = bar
+        self._data[:, slot + self.capacity] = bar
+        self._next = (slot + 1) % self.capacity
+        self._size = min(self._size + 1, self.capacity)
+
+    def __len__(self):
+        return self._size
+
+    def view(self, field=None):
+        """Returns the stored bars oldest first as a read-only view (no copy).
+        With a field name gives a 1-D array, otherwise a 2-D (field x bar) array in BAR_FIELDS order."""
+        start = self._next if self._size == self.capacity else 0
+        block = self._data[:, start:start + self._size]
+        if field is not None:
+            block = block[BAR_FIELDS.index(field)]
+        block = block.view()
+        block.flags.writeable = False
+        return block
+
+    @property
+    def close(self):
+        return self.view('close')
+
+    @property
+    def volume(self):
+        return self.view('volume')
+
+    @property
+    def high(self):
+        return self.view('high')
+
+    @property
+    def low(self):
+        return self.view('low')
+
+    @property
+    def nbytes(self):
+        # Memory held by this symbol's history, fixed at construction time
+        return self._data.nbytes
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import time
+from collections import deque
+import pandas as pd
+
+# Queue policies
+PROCESS_ALL = 'all'        # Handle every bar in order
+KEEP_LATEST = 'latest'     # Only the newest waiting bar per symbol is handled, older ones are coalesced away
+DROP_STALE = 'max_age'     # Bars older than max_age seconds are dropped
+
+BAR_PERIOD = 60  # Seconds a streamed bar covers; bars are stamped at their start, so one is complete bar_period after its timestamp
+
+class BarIngestQueue:
+    """Per-symbol queue between the stream client and the strategy's bar handler.
+    put() only appends and returns, so the websocket reader never waits on the strategy, and a single consumer
+    task feeds the handler symbol by symbol. The policy decides what happens to bars that pile up when the handler falls behind."""
+
+    def __init__(self, handler, policy=PROCESS_ALL, max_age=None, max_depth=None, warn_depth=None, bar_period=BAR_PERIOD):
+        if policy not in (PROCESS_ALL, KEEP_LATEST, DROP_STALE):
+            raise ValueError(f"Unknown bar queue policy: {policy}")
+        if policy == DROP_STALE and max_age is None:
+            raise ValueError("The max_age policy needs max_age (seconds)")
+        self.handler = handler
+        self.policy = policy
+        self.max_age = max_age
+        self.bar_period = bar_period
+        self.max_depth = max_depth  # Per-symbol cap, the oldest bar is dropped beyond it
+        self.warn_depth = warn_depth  # Total backlog that counts as overloaded
+        self._overloaded = False
+        self._queues = {}  # symbol -> deque of (received time, bar)
+        self._ready = asyncio.Queue()  # Symbols that have bars waiting, each listed once
+        self._scheduled = set()
+        self._consumer = None
+        self.counters = {'received': 0, 'processed': 0, 'coalesced': 0, 'dropped_stale': 0, 'dropped_overflow': 0}
+        self.last_lag = 0.0  # Age in seconds of the most recently handled bar (see bar_age)
+        self.max_lag = 0.0
+
+    def start(self):
+        # Starts the consumer task, must be called from inside the running event loop
+        if self._consumer is None:
+            self._consumer = asyncio.ensure_future(self._consume())
+        return self._consumer
+
+    async def put(self, bar):
+        # Handler to pass to conn.subscribe_bars
+        self.counters['received'] += 1
+        queue = self._queues.setdefault(bar.symbol, deque())
+        if self.policy == KEEP_LATEST and queue:
+            self.counters['coalesced'] += len(queue)
+            queue.clear()
+        elif self.max_depth is not None and len(queue) >= self.max_depth:
+            queue.popleft()
+            self.counters['dropped_overflow'] += 1
+        queue.append((time.monotonic(), bar))
+        self._check_overload()
+
+        if bar.symbol not in self._scheduled:
+            self._scheduled.add(bar.symbol)
+            self._ready.put_nowait(bar.symbol)
+
+    def _next_bar(self, symbol):
+        # Pops the next bar to handle for the symbol, applying the max_age policy, or None if nothing is left
+        queue = self._queues[symbol]
+        while queue:
+            received, bar = queue.popleft()
+            lag = self.bar_age(bar, time.monotonic() - received)
+            if self.policy == DROP_STALE and lag > self.max_age:
+                self.counters['dropped_stale'] += 1
+                continue
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            return bar
+        return None
+
+    def bar_age(self, bar, waited):
+        """ Seconds since the bar was complete: the later of the time it waited in the queue and the age from its own
+        timestamp, so bars the stream already delivered late count as stale too. Bars without a timestamp use the wait."""
+        timestamp = getattr(bar, 'timestamp', None)
+        if timestamp is None:
+            return waited
+        completed = pd.Timestamp(timestamp).value / 1e9 + self.bar_period
+        return max(waited, time.time() - completed)
+
+    async def _consume(self):
+        while True:
+            symbol = await self._ready.get()
+            bar = self._next_bar(symbol)
+            if self._queues[symbol]:
+                self._ready.put_nowait(symbol)  # Back of the line, so one busy symbol can't starve the rest
+            else:
+                self._scheduled.discard(symbol)
+            self._check_overload()
+            if bar is None:
+                continue
+            try:
+                await self.handler(bar)
+            except Exception as e:
+                logging.error(f"Error handling bar for {symbol}: {e}")
+            self.counters['processed'] += 1
+
+    def _check_overload(self):
+        # Logs once when the backlog crosses warn_depth and once when it has drained again
+        if self.warn_depth is None:
+            return
+        overloaded = self.depth() >= self.warn_depth
+        if overloaded and not self._overloaded:
+            logging.warning(f"Bar queue overloaded: {self.stats()}")
+        elif self._overloaded and not overloaded:
+            logging.info(f"Bar queue recovered: {self.stats()}")
+        self._overloaded = overloaded
+
+    def depth(self, symbol=None):
+        # Bars waiting for one symbol, or for all of them
+        if symbol is not None:
+            return len(self._queues.get(symbol, ()))
+        return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self):
+        return dict(self.counters, depth=self.depth(), last_lag=round(self.last_lag, 3), max_lag=round(self.max_lag, 3))
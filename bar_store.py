@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+
+"""Local on-disk store of historical bars shared by the backtests, the parameter sweeps and the SMA scripts.
+Each (timeframe, symbol) is kept as one memory-mapped .npy file per column, sorted by time, plus a small meta.json
+that records which dates have been fetched. Reads return zero-copy slices of the memory maps; only dates that are
+missing from the store are fetched, and in offline mode nothing is fetched at all."""
+
+BAR_STORE_DIR = 'data/bars'
+BAR_STORE_OFFLINE = os.getenv('BAR_STORE_OFFLINE', '') == '1'  # Strict offline mode: never fetch, fail on missing data
+BAR_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+TIMEFRAMES = ('minute', 'day')
+META_FILE = 'meta.json'
+
+class OfflineDataMissing(LookupError):
+    """Raised in offline mode when the requested bars are not in the store."""
+
+def _day(value):
+    # Date of a date/timestamp string or Timestamp, as a tz-naive midnight Timestamp (UTC calendar)
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+    return value.normalize()
+
+def _merge_ranges(ranges):
+    # Sorted, non-overlapping [start, end) date ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+class BarStore:
+    """Bars keyed by timeframe ('minute' or 'day'), symbol and date.
+    get() tops up missing dates through a fetcher (see alpaca_fetcher / yfinance_fetcher) and returns the bars;
+    read() / frame() only look at what is already on disk. Date ranges are [start, end): end is exclusive.
+    Today and later dates are never marked as fetched, since their bars are still coming in."""
+
+    def __init__(self, root=BAR_STORE_DIR, fetcher=None, offline=None):
+        self.root = root
+        self.fetcher = fetcher  # fetcher(symbol, timeframe, start, end) -> DataFrame indexed by UTC time with BAR_COLUMNS
+        self.offline = BAR_STORE_OFFLINE if offline is None else offline
+        self._locks = {}  # (timeframe, symbol) -> lock held while that series is written
+        self._locks_lock = threading.Lock()
+        self._maps = {}  # (timeframe, symbol, generation) -> {column: memmap}
+        self.counters = {'reads': 0, 'fetches': 0, 'fetched_bars': 0}
+
+    def _dir(self, timeframe, symbol):
+        if timeframe not in TIMEFRAMES:
+            raise ValueError(f"Unknown timeframe: {timeframe}")
+        return os.path.join(self.root, timeframe, symbol.upper())
+
+    def _lock(self, timeframe, symbol):
+        with self._locks_lock:
+            return self._locks.setdefault((timeframe, symbol.upper()), threading.Lock())
+
+    def _meta(self, timeframe, symbol):
+        path = os.path.join(self._dir(timeframe, symbol), META_FILE)
+        if not os.path.exists(path):
+            return {'generation': 0, 'rows': 0, 'coverage': []}
+        with open(path) as file:
+            return json.load(file)
+
+    def coverage(self, timeframe, symbol):
+        # Fetched [start, end) date ranges as Timestamps
+        return [[pd.Timestamp(start), pd.Timestamp(end)] for start, end in self._meta(timeframe, symbol)['coverage']]
+
+    def missing(self, timeframe, symbol, start, end):
+        """ [start, end) date ranges within the request that have not been fetched yet.
+        Dates from today on always count as missing, so the latest bars are topped up."""
+        start, end = _day(start), _day(end)
+        gaps = []
+        cursor = start
+        for covered_start, covered_end in self.coverage(timeframe, symbol):
+            if covered_end <= cursor:
+                continue
+            if covered_start >= end:
+                break
+            if covered_start > cursor:
+                gaps.append([cursor, min(covered_start, end)])
+            cursor = max(cursor, covered_end)
+        if cursor < end:
+            gaps.append([cursor, end])
+        return gaps
+
+    def _arrays(self, timeframe, symbol, meta):
+        # Memory maps of every column of the current generation, opened once
+        key = (timeframe, symbol.upper(), meta['generation'])
+        arrays = self._maps.get(key)
+        if arrays is None:
+            directory = os.path.join(self._dir(timeframe, symbol), f"gen-{meta['generation']}")
+            arrays = {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode='r') for column in ('time',) + BAR_COLUMNS}
+            self._maps[key] = arrays
+        return arrays
+
+    def read(self, symbol, timeframe, start=None, end=None):
+        """ Bars on disk between start (inclusive) and end (exclusive) as a dict of read-only arrays:
+        'time' (int64 nanoseconds, UTC) and BAR_COLUMNS. The arrays are slices of memory maps, nothing is copied."""
+        self.counters['reads'] += 1
+        meta = self._meta(timeframe, symbol)
+        if meta['rows'] == 0:
+            return {column: np.empty(0, dtype=np.int64 if column == 'time' else np.float64) for column in ('time',) + BAR_COLUMNS}
+        try:
+            arrays = self._arrays(timeframe, symbol, meta)
+        except FileNotFoundError:
+            # A writer swapped in a new generation between reading meta.json and opening the files
+            meta = self._meta(timeframe, symbol)
+            arrays = self._arrays(timeframe, symbol, meta)
+        times = arrays['time']
+        first = np.searchsorted(times, _day(start).value) if start is not None else 0
+        last = np.searchsorted(times, _day(end).value) if end is not None else len(times)
+        return {column: values[first:last] for column, values in arrays.items()}
+
+    def frame(self, symbol, timeframe, start=None, end=None):
+        # read() as a DataFrame indexed by UTC 'timestamp', like api.get_bars(...).df
+        arrays = self.read(symbol, timeframe, start, end)
+        index = pd.DatetimeIndex(arrays['time'].astype('datetime64[ns]'), name='timestamp').tz_localize('UTC')
+        return pd.DataFrame({column: arrays[column] for column in BAR_COLUMNS}, index=index)
+
+    def get(self, symbol, timeframe, start, end, fetcher=None):
+        # Tops up missing dates (unless offline) and returns frame(); see missing() for what counts as missing
+        self.ensure(symbol, timeframe, start, end, fetcher)
+        return self.frame(symbol, timeframe, start, end)
+
+    def ensure(self, symbol, timeframe, start, end, fetcher=None):
+        """ Fetches the missing [start, end) ranges for one symbol and adds them to the store.
+        Raises OfflineDataMissing in offline mode if anything is missing. Returns the number of bars fetched."""
+        fetcher = fetcher or self.fetcher
+        gaps = self.missing(timeframe, symbol, start, end)
+        if not gaps:
+            return 0
+        if self.offline:
+            raise OfflineDataMissing(f"{symbol} {timeframe} bars for {gaps[0][0].date()} to {gaps[-1][1].date()} are not in {self.root} (offline mode)")
+        if fetcher is None:
+            raise ValueError("No fetcher configured for missing bars")
+
+        fetched = 0
+        with self._lock(timeframe, symbol):
+            for gap_start, gap_end in self.missing(timeframe, symbol, start, end):  # Re-checked, another thread may have filled it
+                bars = fetcher(symbol, timeframe, gap_start, gap_end)
+                self.counters['fetches'] += 1
+                self.counters['fetched_bars'] += len(bars)
+                fetched += len(bars)
+                self.add(symbol, timeframe, bars, gap_start, gap_end)
+        logging.info(f"Fetched {fetched} {timeframe} bars for {symbol}")
+        return fetched
+
+    def add(self, symbol, timeframe, bars, start, end):
+        """ Merges bars (DataFrame indexed by time with BAR_COLUMNS) into the store and marks [start, end) as fetched,
+        up to yesterday. Rows with the same timestamp as stored ones replace them.
+        A new generation of column files is written and then swapped in by rewriting meta.json, so readers never see a partial write."""
+        directory = self._dir(timeframe, symbol)
+        os.makedirs(directory, exist_ok=True)
+        meta = self._meta(timeframe, symbol)
+
+        index = pd.DatetimeIndex(bars.index)
+        if index.tz is not None:
+            index = index.tz_convert('UTC').tz_localize(None)
+        new = {'time': index.values.astype('datetime64[ns]').astype(np.int64)}
+        for column in BAR_COLUMNS:
+            new[column] = bars[column].to_numpy(dtype=np.float64)
+
+        if meta['rows']:
+            old = self._arrays(timeframe, symbol, meta)
+            merged = {column: np.concatenate([old[column], new[column]]) for column in new}
+        else:
+            merged = new
+        order = np.argsort(merged['time'], kind='stable')
+        merged = {column: values[order] for column, values in merged.items()}
+        # Keep the last (newest) of rows sharing a timestamp
+        keep = np.ones(len(merged['time']), dtype=bool)
+        keep[:-1] = merged['time'][1:] != merged['time'][:-1]
+        merged = {column: values[keep] for column, values in merged.items()}
+
+        generation = meta['generation'] + 1
+        generation_dir = os.path.join(directory, f"gen-{generation}")
+        shutil.rmtree(generation_dir, ignore_errors=True)  # Leftover of a crashed write
+        os.makedirs(generation_dir)
+        for column, values in merged.items():
+            np.save(os.path.join(generation_dir, f"{column}.npy"), values)
+
+        today = _day(datetime.now(timezone.utc).date())
+        coverage = [[pd.Timestamp(s), pd.Timestamp(e)] for s, e in meta['coverage']]
+        covered_end = min(_day(end), today)
+        if _day(start) < covered_end:
+            coverage.append([_day(start), covered_end])
+        meta = {
+            'generation': generation,
+            'rows': int(len(merged['time'])),
+            'coverage': [[str(s.date()), str(e.date())] for s, e in _merge_ranges(coverage)]
+        }
+        path = os.path.join(directory, META_FILE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(path + '.tmp', path)
+        shutil.rmtree(os.path.join(directory, f"gen-{generation - 1}"), ignore_errors=True)  # Open memory maps stay valid
+        self._maps.pop((timeframe, symbol.upper(), generation - 1), None)
+
+    def symbols(self, timeframe):
+        directory = os.path.join(self.root, timeframe)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+def alpaca_fetcher(api, feed='iex', adjustment='raw'):
+    # Fetcher for BarStore backed by an alpaca_trade_api REST client (get_bars pages through long ranges itself)
+    import alpaca_trade_api as tradeapi
+    timeframes = {'minute': tradeapi.rest.TimeFrame.Minute, 'day': tradeapi.rest.TimeFrame.Day}
+
+    def fetch(symbol, timeframe, start, end):
+        # RFC-3339 bounds; end is exclusive in the store, so stop one second before it
+        bars = api.get_bars(symbol, timeframes[timeframe], start=start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                            end=(end - pd.Timedelta(seconds=1)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                            adjustment=adjustment, feed=feed).df
+        return bars[list(BAR_COLUMNS)] if len(bars) else pd.DataFrame(columns=list(BAR_COLUMNS), index=pd.DatetimeIndex([], tz='UTC'))
+    return fetch
+
+def yfinance_fetcher(auto_adjust=False):
+    # Fetcher for BarStore backed by yfinance (only imported when something actually has to be downloaded)
+    intervals = {'minute': '1m', 'day': '1d'}
+
+    def fetch(symbol, timeframe, start, end):
+        import yfinance as yf
+        data = yf.download(symbol, start=start.strftime('%Y-%m-%d'), end=end.strftime('%Y-%m-%d'),
+                           interval=intervals[timeframe], auto_adjust=auto_adjust, progress=False)
+        if isinstance(data.columns, pd.MultiIndex):
+            data.columns = data.columns.get_level_values(0)  # Newer yfinance adds a ticker level
+        data = data.rename(columns=str.lower)
+        if data.index.tz is None:
+            data.index = data.index.tz_localize('UTC')
+        return data[list(BAR_COLUMNS)]
+    return fetch
+
+_default_store = None
+
+def get_bar_store():
+    # Process-wide store in BAR_STORE_DIR (honours BAR_STORE_OFFLINE)
+    global _default_store
+    if _default_store is None:
+        _default_store = BarStore()
+    return _default_store
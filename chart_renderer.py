@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+
+"""Chart rendering for the performance report. Series are downsampled with LTTB before plotting, charts whose
+input hasn't changed since the last render are skipped, and rendering can run in a separate process so the
+report text is available straight away."""
+
+CHART_MAX_POINTS = 2000  # Points per chart after downsampling, more than a 10x6 inch figure can show
+
+# Column plotted -> (file name, title)
+CHARTS = {
+    'Cumulative Return': ('cumulative_return.png', 'Cumulative Return'),
+    'Daily Return': ('daily_return.png', 'Daily Return'),
+    'Drawdown': ('drawdown.png', 'Drawdown')
+}
+
+def lttb(x, y, max_points):
+    """ Largest-Triangle-Three-Buckets downsampling. Returns the indices of the points to keep:
+    always the first and last, plus one per bucket chosen to keep the visual shape (peaks, dips, drawdowns)."""
+    n = len(y)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)  # max_points - 2 buckets between the end points
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # Average of the next bucket (or the last point) is the third corner of the triangle
+        next_start, next_stop = stop, edges[bucket + 2] if bucket + 2 < len(edges) else n
+        average_x = x[next_start:next_stop].mean()
+        average_y = y[next_start:next_stop].mean()
+        areas = np.abs((x[previous] - average_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (average_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+    return kept
+
+def downsample(timestamps, values, max_points=CHART_MAX_POINTS):
+    # Drops NaNs (e.g. the first daily return) and keeps at most max_points points of the series
+    timestamps = np.asarray(timestamps).astype('datetime64[ns]')
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    timestamps, values = timestamps[valid], values[valid]
+    kept = lttb(timestamps.astype(np.int64), values, max_points)
+    return timestamps[kept], values[kept]
+
+def _fingerprint(timestamps, values, title):
+    digest = hashlib.sha1()
+    digest.update(title.encode())
+    digest.update(np.ascontiguousarray(timestamps).astype('datetime64[ns]').tobytes())
+    digest.update(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def _is_current(path, fingerprint):
+    # True if path was rendered from the same input last time (the fingerprint is kept in a sidecar file)
+    try:
+        with open(path + '.sha1') as file:
+            return os.path.exists(path) and file.read() == fingerprint
+    except OSError:
+        return False
+
+def _render(jobs):
+    # Plots already-downsampled series; runs in the caller or in a child process
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    for path, title, timestamps, values, fingerprint in jobs:
+        plt.figure(figsize=(10, 6))
+        pd.Series(values, index=pd.DatetimeIndex(timestamps, name='Timestamp')).plot()
+        plt.title(title)
+        plt.savefig(path)
+        plt.close()
+        with open(path + '.sha1', 'w') as file:
+            file.write(fingerprint)
+
+def render_charts(series, directory, max_points=CHART_MAX_POINTS, background=False):
+    """ Renders the report charts from {column: (timestamps, values)} for the CHARTS columns (see report_engine.ChartSeries).
+    Unchanged charts are skipped. With background=True the plotting runs in a separate process, which is returned
+    (None when there is nothing to render); otherwise it runs here."""
+    jobs = []
+    for column, (file_name, title) in CHARTS.items():
+        path = os.path.join(directory, file_name)
+        timestamps, values = series[column]
+        fingerprint = _fingerprint(timestamps, values, f"{title}:{max_points}")
+        if _is_current(path, fingerprint):
+            logging.info(f"Chart {path} is up to date, skipping")
+            continue
+        jobs.append((path, title) + downsample(timestamps, values, max_points) + (fingerprint,))
+
+    if not jobs:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    if not background:
+        _render(jobs)
+        return None
+    process = multiprocessing.Process(target=_render, args=(jobs,), name='chart-renderer')
+    process.start()
+    return process
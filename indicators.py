@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from collections import deque
 
 """Args I use in functions:
         high (pd.Series): Series of high prices.
@@ -41,4 +42,193 @@ def calculate_rsi(close_prices, window=14):
     loss = (-delta.where(delta < 0, 0)).rolling(window).mean()  # Average loss over the window
     rs = gain / loss  # Relative Strength (RS)
     rsi = 100 - (100 / (1 + rs))  # RSI calculation
-    return rsi
\ No newline at end of file
+    return rsi
+
+def _as_2d(values):
+    # Accepts a (time x symbol) NumPy array, a wide DataFrame or a single Series and returns a float 2-D array
+    array = np.asarray(values, dtype=np.float64)
+    return array.reshape(-1, 1) if array.ndim == 1 else array
+
+def _like_input(result, template):
+    # Wraps a kernel result back into the caller's container type
+    if isinstance(template, pd.DataFrame):
+        return pd.DataFrame(result, index=template.index, columns=template.columns)
+    if isinstance(template, pd.Series):
+        return pd.Series(result[:, 0], index=template.index, name=template.name)
+    if np.ndim(template) == 1:
+        return result[:, 0]
+    return result
+
+def _prefix_sums(values):
+    """Cumulative sums used to get any rolling window sum with one subtraction.
+    Also counts NaNs and non-zero values, so windows pandas would leave NaN (or return an exact 0 for) come out NaN (or 0) here too."""
+    missing = np.isnan(values)
+    filled = np.where(missing, 0.0, values)
+    padding = np.zeros((1, values.shape[1]))
+    total = np.concatenate([padding, np.cumsum(filled, axis=0)])
+    nans = np.concatenate([padding, np.cumsum(missing, axis=0)])
+    nonzero = np.concatenate([padding, np.cumsum(filled != 0, axis=0)])
+    return total, nans, nonzero
+
+def _rolling_sum(prefix, window):
+    # DataFrame.rolling(window).sum() column by column, matching it within float tolerance (prefix sums round differently)
+    total, nans, nonzero = prefix
+    rows = total.shape[0] - 1
+    result = np.full((rows, total.shape[1]), np.nan)
+    if rows < window:
+        return result
+    sums = total[window:] - total[:-window]
+    sums[(nonzero[window:] - nonzero[:-window]) == 0] = 0.0  # No cumulative sum round-off on all-zero windows
+    sums[(nans[window:] - nans[:-window]) > 0] = np.nan
+    result[window - 1:] = sums
+    return result
+
+def _deltas(values):
+    # Equivalent of DataFrame.diff() along the time axis
+    delta = np.full(values.shape, np.nan)
+    delta[1:] = values[1:] - values[:-1]
+    return delta
+
+def _gain_loss_prefix(values):
+    # Prefix sums of gains and losses; the NaN first diff becomes 0 just like delta.where(...) does in pandas
+    delta = _deltas(values)
+    with np.errstate(invalid='ignore'):
+        gain = np.where(delta > 0, delta, 0.0)
+        loss = np.where(delta < 0, -delta, 0.0)
+    return _prefix_sums(gain), _prefix_sums(loss)
+
+def _rsi_from_window_sums(gain, loss):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = gain / loss
+        return 100 - (100 / (1 + rs))
+
+def _true_range(high, low, close):
+    previous_close = np.full(close.shape, np.nan)
+    previous_close[1:] = close[:-1]
+    return np.maximum(np.maximum(high - low, np.abs(high - previous_close)), np.abs(low - previous_close))
+
+def calculate_rsi_batch(close_prices, window=14):
+    """ Vectorized calculate_rsi for many symbols at once, matching it within float tolerance (see tests/indicator_regression.py).
+    Takes a (time x symbol) array or wide DataFrame of closes and returns RSI of the same shape."""
+    gain_prefix, loss_prefix = _gain_loss_prefix(_as_2d(close_prices))
+    rsi = _rsi_from_window_sums(_rolling_sum(gain_prefix, window), _rolling_sum(loss_prefix, window))
+    return _like_input(rsi, close_prices)
+
+def calculate_volume_rsi_batch(volume, window):
+    """ Vectorized calculate_volume_rsi for a (time x symbol) array or wide DataFrame of volumes, matching it within float tolerance."""
+    gain_prefix, loss_prefix = _gain_loss_prefix(_as_2d(volume))
+    volume_rsi = _rsi_from_window_sums(_rolling_sum(gain_prefix, window), _rolling_sum(loss_prefix, window))
+    return _like_input(volume_rsi, volume)
+
+def calculate_atr_batch(high, low, close, window):
+    """ Vectorized calculate_atr, matching it within float tolerance;
+    high, low and close are (time x symbol) arrays or wide DataFrames of the same shape."""
+    tr = _true_range(_as_2d(high), _as_2d(low), _as_2d(close))
+    atr = _rolling_sum(_prefix_sums(tr), window) / window
+    return _like_input(atr, close)
+
+def calculate_indicators_multi_window(close, volume, high, low, windows):
+    """ Computes RSI, Volume RSI and ATR for several windows in one pass over the data, for parameter sweeps.
+    The gain/loss and true range prefix sums are built once and every window is just a subtraction over them,
+    so the cost grows with the number of windows rather than the number of parameter combinations.
+    Inputs are Series or (time x symbol) arrays/wide DataFrames, as for the batch functions, and the values match theirs exactly
+    (and calculate_rsi, calculate_volume_rsi and calculate_atr within float tolerance).
+    Returns {window: {'rsi': ..., 'volume_rsi': ..., 'atr': ...}}."""
+    price_gain_prefix, price_loss_prefix = _gain_loss_prefix(_as_2d(close))
+    volume_gain_prefix, volume_loss_prefix = _gain_loss_prefix(_as_2d(volume))
+    tr_prefix = _prefix_sums(_true_range(_as_2d(high), _as_2d(low), _as_2d(close)))
+
+    results = {}
+    for window in sorted(set(windows)):
+        rsi = _rsi_from_window_sums(_rolling_sum(price_gain_prefix, window), _rolling_sum(price_loss_prefix, window))
+        volume_rsi = _rsi_from_window_sums(_rolling_sum(volume_gain_prefix, window), _rolling_sum(volume_loss_prefix, window))
+        atr = _rolling_sum(tr_prefix, window) / window
+        results[window] = {
+            'rsi': _like_input(rsi, close),
+            'volume_rsi': _like_input(volume_rsi, volume),
+            'atr': _like_input(atr, close)
+        }
+    return results
+
+def _rsi_from_sums(gain, loss):
+    # Same result as 100 - (100 / (1 + gain / loss)) in pandas, including its inf/NaN handling
+    if loss == 0:
+        return 100.0 if gain > 0 else np.nan
+    return 100 - (100 / (1 + gain / loss))
+
+class StreamingIndicators:
+    """Incremental RSI and Volume RSI for a single symbol.
+    Keeps running gain/loss sums so each update() costs O(1) instead of rebuilding a DataFrame.
+    Like generate_signals always did, the indicators cover the last `window` bars: calculate_rsi and calculate_volume_rsi
+    over that slice see window - 1 real diffs plus the NaN first diff pandas turns into a zero gain and loss.
+    After every bar the values match those functions run over the last `window` bars (within float tolerance)."""
+
+    def __init__(self, window):
+        self.window = window
+        self.count = 0  # Number of bars seen
+        self.last_close = None
+        self.last_volume = None
+        self.returns = np.nan
+        # Diffs currently inside the window (at most window - 1), so the oldest one can be subtracted when it drops out
+        self._price_gains = deque()
+        self._price_losses = deque()
+        self._volume_gains = deque()
+        self._volume_losses = deque()
+        self._sums = [0.0, 0.0, 0.0, 0.0]  # price gain, price loss, volume gain, volume loss
+        self._updates_since_resum = 0
+
+    def update(self, close, volume, high, low):
+        # Adds one bar and updates all indicators
+        if self.last_close is None:
+            self.returns = np.nan
+        else:
+            price_delta = close - self.last_close
+            volume_delta = volume - self.last_volume
+            self.returns = close / self.last_close - 1 if self.last_close != 0 else np.nan
+            self._push(self._price_gains, 0, max(price_delta, 0.0))
+            self._push(self._price_losses, 1, max(-price_delta, 0.0))
+            self._push(self._volume_gains, 2, max(volume_delta, 0.0))
+            self._push(self._volume_losses, 3, max(-volume_delta, 0.0))
+
+        self.last_close = close
+        self.last_volume = volume
+        self.count += 1
+
+        # Re-sum the windows from scratch every `window` bars so floating point drift can't build up (amortised O(1))
+        self._updates_since_resum += 1
+        if self._updates_since_resum >= self.window:
+            self._resum()
+
+    def _push(self, values, index, value):
+        values.append(value)
+        self._sums[index] += value
+        if len(values) > self.window - 1:
+            self._sums[index] -= values.popleft()
+
+    def _resum(self):
+        for index, values in enumerate((self._price_gains, self._price_losses, self._volume_gains, self._volume_losses)):
+            self._sums[index] = float(sum(values))
+        self._updates_since_resum = 0
+
+    @property
+    def ready(self):
+        # Enough bars for RSI and Volume RSI (same condition generate_signals checks)
+        return self.count >= self.window
+
+    @property
+    def rsi(self):
+        if not self.ready:
+            return np.nan
+        return _rsi_from_sums(self._sums[0], self._sums[1])
+
+    @property
+    def volume_rsi(self):
+        if not self.ready:
+            return np.nan
+        return _rsi_from_sums(self._sums[2], self._sums[3])
+
+    @property
+    def atr(self):
+        # calculate_atr over the last `window` bars is always NaN: the first bar in the slice has no previous close,
+        # so its true range is NaN and the window is never complete. Kept for the same printed output.
+        return np.nan
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+# Column types for the two logs, in CSV column order. 'str' columns are stored as fixed-width unicode.
+TRADE_LOG_SCHEMA = {
+    'Timestamp': 'datetime64[s]',
+    'Symbol': 'str',
+    'Action': 'str',
+    'Quantity': 'float64',
+    'Price': 'float64',
+    'Order ID': 'str',
+    'Status': 'str'
+}
+PERFORMANCE_LOG_SCHEMA = {
+    'Timestamp': 'datetime64[s]',
+    'Portfolio Value': 'float64',
+    'Cash Balance': 'float64',
+    'Positions': 'str',
+    'Daily High': 'float64',
+    'Daily Low': 'float64',
+    'Daily Close': 'float64',
+    'Volume': 'float64'
+}
+
+INDEX_FILE = '_index.json'
+
+def _to_float(value):
+    # Log rows carry API strings and None, missing values become NaN
+    if value is None or value == '':
+        return np.nan
+    return float(value)
+
+class ColumnarLogStore:
+    """Append-friendly columnar storage for the trade and performance logs.
+    Rows are partitioned by date into directories of .npz chunks (one typed array per column), and a small JSON index
+    records each chunk's time range, row count and symbols, so queries only open the chunks they need."""
+
+    def __init__(self, root, schema, timestamp_column='Timestamp', symbol_column=None, compact_after=32):
+        self.root = root
+        self.schema = schema
+        self.columns = list(schema)
+        self.timestamp_column = timestamp_column
+        self.symbol_column = symbol_column  # Column indexed for symbol lookups, if any
+        self.compact_after = compact_after  # Chunks per partition before they are merged into one
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._index = self._load_index()
+
+    def _load_index(self):
+        path = os.path.join(self.root, INDEX_FILE)
+        if not os.path.exists(path):
+            return {'next_chunk': 0, 'chunks': []}
+        with open(path) as file:
+            return json.load(file)
+
+    def _save_index(self):
+        # Written to a temp file and renamed, so a crash never leaves a half-written index
+        path = os.path.join(self.root, INDEX_FILE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self._index, file)
+        os.replace(path + '.tmp', path)
+
+    def _typed_columns(self, rows):
+        # Turns row lists (CSV column order) into one typed NumPy array per column
+        arrays = {}
+        for position, (name, dtype) in enumerate(self.schema.items()):
+            values = [row[position] if position < len(row) else None for row in rows]
+            if dtype == 'str':
+                arrays[name] = np.array(['' if value is None else str(value) for value in values], dtype=np.str_)
+            elif dtype.startswith('datetime64'):
+                arrays[name] = pd.to_datetime(pd.Series(values)).to_numpy().astype(dtype)
+            else:
+                arrays[name] = np.array([_to_float(value) for value in values], dtype=dtype)
+        return arrays
+
+    def _write_chunk(self, date, arrays):
+        # Caller holds the lock
+        relative = os.path.join(date, f"part-{self._index['next_chunk']:06d}.npz")
+        os.makedirs(os.path.join(self.root, date), exist_ok=True)
+        # Stored under numbered keys because column names like 'Order ID' aren't valid npz keys on every platform
+        np.savez(os.path.join(self.root, relative), **{f"c{position}": arrays[name] for position, name in enumerate(self.columns)})
+        timestamps = arrays[self.timestamp_column]
+        entry = {
+            'file': relative,
+            'date': date,
+            'start': str(timestamps.min()),
+            'end': str(timestamps.max()),
+            'rows': int(len(timestamps))
+        }
+        if self.symbol_column is not None:
+            entry['symbols'] = sorted(set(arrays[self.symbol_column].tolist()))
+        self._index['next_chunk'] += 1
+        self._index['chunks'].append(entry)
+
+    def _read_chunk(self, entry, columns):
+        with np.load(os.path.join(self.root, entry['file']), allow_pickle=False) as chunk:
+            return {name: chunk[f"c{self.columns.index(name)}"] for name in columns}
+
+    def append(self, rows):
+        """ Appends rows (lists in schema column order) as new chunks, one per date. Never rewrites existing data
+        apart from compacting a partition once it has more than compact_after chunks."""
+        if not rows:
+            return
+        arrays = self._typed_columns(rows)
+        dates = arrays[self.timestamp_column].astype('datetime64[D]').astype(str)
+        with self._lock:
+            for date in np.unique(dates):
+                mask = dates == date
+                self._write_chunk(date, {name: values[mask] for name, values in arrays.items()})
+                if sum(1 for entry in self._index['chunks'] if entry['date'] == date) > self.compact_after:
+                    self._compact(date)
+            self._save_index()
+
+    def _compact(self, date):
+        # Merges all chunks of one date partition into a single chunk, caller holds the lock
+        entries = [entry for entry in self._index['chunks'] if entry['date'] == date]
+        parts = [self._read_chunk(entry, self.columns) for entry in entries]
+        merged = {name: np.concatenate([part[name] for part in parts]) for name in self.columns}
+        order = np.argsort(merged[self.timestamp_column], kind='stable')
+        self._index['chunks'] = [entry for entry in self._index['chunks'] if entry['date'] != date]
+        self._write_chunk(date, {name: values[order] for name, values in merged.items()})
+        self._save_index()
+        for entry in entries:
+            os.remove(os.path.join(self.root, entry['file']))
+
+    def chunks(self, start=None, end=None, symbols=None):
+        # Index entries that can hold rows in [start, end] for the given symbols
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        wanted = set(symbols) if symbols is not None else None
+        with self._lock:
+            entries = list(self._index['chunks'])
+        selected = []
+        for entry in entries:
+            if start is not None and pd.Timestamp(entry['end']) < start:
+                continue
+            if end is not None and pd.Timestamp(entry['start']) > end:
+                continue
+            if wanted is not None and 'symbols' in entry and not wanted.intersection(entry['symbols']):
+                continue
+            selected.append(entry)
+        return selected
+
+    def read(self, start=None, end=None, symbols=None, columns=None):
+        """ Returns the rows between start and end (inclusive), optionally for some symbols only, as a DataFrame sorted by time.
+        Only the chunks the index says can match are opened."""
+        columns = list(columns) if columns is not None else self.columns
+        needed = list(dict.fromkeys(columns + [self.timestamp_column] + ([self.symbol_column] if symbols is not None else [])))
+        parts = [self._read_chunk(entry, needed) for entry in self.chunks(start, end, symbols)]
+        if not parts:
+            return pd.DataFrame({name: np.array([], dtype=object if self.schema[name] == 'str' else self.schema[name]) for name in columns})
+
+        data = {name: np.concatenate([part[name] for part in parts]) for name in needed}
+        mask = np.ones(len(data[self.timestamp_column]), dtype=bool)
+        if start is not None:
+            mask &= data[self.timestamp_column] >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            mask &= data[self.timestamp_column] <= np.datetime64(pd.Timestamp(end))
+        if symbols is not None:
+            mask &= np.isin(data[self.symbol_column], list(symbols))
+        frame = pd.DataFrame({name: data[name][mask] for name in needed})
+        frame = frame.sort_values(self.timestamp_column, kind='stable').reset_index(drop=True)
+        return frame[columns]
+
+    def iter_read(self, start=None, end=None, columns=None):
+        # Yields the rows between start and end one date partition at a time, so large logs never have to fit in memory
+        entries = self.chunks(start, end)
+        for date in sorted(set(str(entry['date']) for entry in entries)):
+            day_end = pd.Timestamp(date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+            day_start = pd.Timestamp(date)
+            frame = self.read(max(day_start, pd.Timestamp(start)) if start is not None else day_start,
+                              min(day_end, pd.Timestamp(end)) if end is not None else day_end, columns=columns)
+            if len(frame):
+                yield frame
+
+    def import_csv(self, path, chunk_rows=100000):
+        # Loads an existing CSV log (header row in schema order) into the store, chunk_rows at a time
+        for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+            self.append(chunk.reindex(columns=self.columns).fillna('').values.tolist())
+
+    def export_csv(self, path, start=None, end=None, symbols=None):
+        # Writes the selected rows back out in the original CSV layout
+        frame = self.read(start, end, symbols)
+        frame[self.timestamp_column] = frame[self.timestamp_column].dt.strftime('%Y-%m-%d %H:%M:%S')
+        frame.to_csv(path, index=False)
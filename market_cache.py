@@ -0,0 +1,71 @@
+import threading
+import time
+import alpaca_trade_api as tradeapi
+
+# How long each kind of reference data is reused before it is fetched again (seconds)
+ACCOUNT_TTL = 30  # Account and positions for callers without the local portfolio mirror (e.g. a standalone performance log)
+DAILY_BAR_TTL = 15 * 60  # Benchmark daily bars barely move within the day
+
+class TTLCache:
+    """Small thread-safe cache for reference data (account snapshots, positions, benchmark bars).
+    get() returns the stored value while it is younger than its TTL and calls the loader otherwise.
+    Hit/miss counters show how many REST calls it saved."""
+
+    def __init__(self, default_ttl=60):
+        self.default_ttl = default_ttl
+        self._entries = {}  # key -> (value, expiry time)
+        self._lock = threading.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'puts': 0, 'errors': 0}
+
+    def get(self, key, loader, ttl=None):
+        # Cached value for key, or loader() stored for ttl seconds if it is missing or expired
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                self.counters['hits'] += 1
+                return entry[0]
+            self.counters['misses'] += 1
+
+        try:
+            value = loader()
+        except Exception:
+            with self._lock:
+                self.counters['errors'] += 1
+            raise
+        self.put(key, value, ttl, count=False)
+        return value
+
+    def put(self, key, value, ttl=None, count=True):
+        # Stores a value fetched elsewhere (e.g. by a portfolio sync) so other readers can reuse it
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            if count:
+                self.counters['puts'] += 1
+
+    def invalidate(self, key=None):
+        # Drops one key, or everything
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            hit_rate = round(self.counters['hits'] / lookups, 3) if lookups else None
+            return dict(self.counters, size=len(self._entries), hit_rate=hit_rate)
+
+# One cache for the whole process, shared by the strategy and the performance log
+market_cache = TTLCache()
+
+def get_account(api, ttl=ACCOUNT_TTL):
+    return market_cache.get('account', api.get_account, ttl)
+
+def get_positions(api, ttl=ACCOUNT_TTL):
+    return market_cache.get('positions', api.list_positions, ttl)
+
+def get_daily_bar(api, symbol, ttl=DAILY_BAR_TTL):
+    # Latest daily bar for the symbol as a one-row DataFrame
+    return market_cache.get(('daily_bar', symbol), lambda: api.get_bars(symbol, tradeapi.rest.TimeFrame.Day, limit=1).df, ttl)
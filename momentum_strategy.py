@@ -1,12 +1,18 @@
 import alpaca_trade_api as tradeapi
-import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import asyncio
 import logging
-from trade_log import initialize_trade_log, log_trade, wait_for_fill
-from performance_metrics import initialize_performance_log, log_portfolio_value
-from indicators import calculate_volume_rsi, calculate_atr, calculate_rsi
+import threading
+from trade_log import initialize_trade_log, OrderTracker
+from performance_metrics import initialize_performance_log, log_portfolio_value, seed_performance_accumulator, generate_live_report
+from indicators import StreamingIndicators, calculate_rsi_batch, calculate_volume_rsi_batch
+from bar_buffer import BarRingBuffer
+from portfolio_state import PortfolioState
+from order_executor import OrderExecutor
+from request_scheduler import ScheduledAPI, broker_scheduler
+from bar_queue import BarIngestQueue, PROCESS_ALL
+from market_cache import market_cache
 from dotenv import load_dotenv
 import os
 
@@ -19,19 +25,21 @@ ALPACA_API_KEY = os.getenv('ALPACA_API_KEY')
 ALPACA_SECRET_KEY = os.getenv('ALPACA_SECRET_KEY')
 BASE_URL = 'https://paper-api.alpaca.markets'
 
-api = tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2')
+# Every REST call goes through the shared rate limiter (orders first, duplicate reads coalesced)
+api = ScheduledAPI(tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2'), broker_scheduler)
 conn = tradeapi.stream.Stream(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, data_feed='iex')
 
 symbols = ['AAPL', 'MSFT', 'GOOG', 'NVDA', 'JPM', 'BAC', 'V', 'JNJ', 'PFE', 'PG', 'KO', 'SPY', 'QQQ', 'DIA', 'IWM', 'GLD', 'SLV', 'XOM', 'CVX']
 window = 30
-price_histories = {symbol: [] for symbol in symbols}
-volume_histories = {symbol: [] for symbol in symbols}
-high_histories = {symbol: [] for symbol in symbols}
-low_histories = {symbol: [] for symbol in symbols}
+bar_histories = {symbol: BarRingBuffer(window) for symbol in symbols}  # Last `window` bars per symbol
+indicator_engines = {symbol: StreamingIndicators(window) for symbol in symbols}  # Incremental RSI and Volume RSI per symbol
+latest_prices = {}  # symbol -> (last close, time it was received), fed by the bar stream
 stop_loss_levels = {}
 take_profit_levels = {}
 active_trades = []
-last_log_time = datetime.now() - timedelta(minutes=5)  # Initialize last log time to 5 minutes ago
+portfolio_log_interval = timedelta(minutes=1)  # How often execute_trade logs the portfolio value (taken from the local portfolio mirror)
+stats_log_interval = timedelta(minutes=1)  # How often the bar queue, broker request and cache stats are logged, trades or not
+last_log_time = datetime.now() - portfolio_log_interval  # Log on the first trade
 
 # Risk management parameters
 max_daily_loss = 0.05  # 5% of portfolio
@@ -41,56 +49,97 @@ stop_loss_pct = 0.015   # 1.5% stop loss
 take_profit_pct = 0.06 # 6% take profit
 initial_portfolio_value = None
 current_daily_loss = 0
-
-def get_portfolio():  # Retrieves the current portfolio details including cash, holdings, and total portfolio value.
-    try:
-        account = api.get_account() # Fetches account details using Alpaca API
-        cash = float(account.cash)  # Available cash in the account
-        portfolio = {position.symbol: float(position.qty) for position in api.list_positions()}  # Extracts positions into a dictionary with symbol as key and quantity as value
-        portfolio_value = float(account.equity) # Total portfolio value (equity)
-        return cash, portfolio, portfolio_value
-    except Exception as e:
-        logging.error(f"Error fetching portfolio: {e}")
-        return 0, {}, 0  # Default values in case of error
-
-def generate_signals(price_history, volume_history, high_history, low_history):
-    """ Generates trading signals based on historical price, volume, high, and low data.
+max_price_age = timedelta(seconds=90)  # Cached prices older than this are refreshed from the REST API
+portfolio_reconcile_interval = timedelta(minutes=5)  # How often the local portfolio mirror is checked against the broker
+portfolio_state = PortfolioState(api, portfolio_reconcile_interval)
+order_tracker = OrderTracker()  # Resolves order futures from the trade-updates stream and logs real fill prices
+order_reconcile_interval = timedelta(minutes=1)  # How often orders still waiting for their final trade update are checked with get_order
+order_workers = 4  # Threads doing broker calls for trade intents
+max_pending_orders = 100  # Trade intents allowed in flight before new ones are dropped
+order_executor = OrderExecutor(order_workers, max_pending_orders)
+risk_lock = threading.Lock()  # execute_trade runs on worker threads, guards the shared risk counters
+batch_grace_period = 5  # Seconds to wait for late symbols after the first bar of a minute (batch mode)
+pending_batch = {}  # symbol -> bar collected for the minute being batched
+batch_complete = asyncio.Event()  # Set once every symbol has reported for the current minute
+batch_task = None  # Waits out the grace period, then evaluates the batch
+bar_queue = None  # BarIngestQueue between the stream and the bar handler, created when the strategy starts
+
+def get_portfolio():  # Returns cash, holdings and total portfolio value from the local account mirror (never a REST call).
+    return portfolio_state.snapshot()
+
+def generate_signals(indicators):
+    """ Generates trading signals from the symbol's streaming indicators (see indicators.StreamingIndicators).
         Returns:
             int: Trading signal (-1 for sell, 0 for hold, 1 for buy)."""
 
     # Ensures if it has enough data to calculate indicators
-    if len(price_history) < window or len(volume_history) < window:
+    if not indicators.ready:
         return 0  # Neutral signal if not enough data
 
-    # Creates a DataFrame from the historical data
-    data = pd.DataFrame({
-        'price': price_history,       # List of historical closing prices
-        'volume': volume_history,     # List of historical volume data
-        'high': high_history,         # List of historical high prices
-        'low': low_history            # List of historical low prices
-    })
-    # Additional indicators
-    data['returns'] = data['price'].pct_change()
-    data['volume_rsi'] = calculate_volume_rsi(data['volume'], window)
-    data['atr'] = calculate_atr(data['high'], data['low'], data['price'], window)
-    data['rsi'] = calculate_rsi(data['price'], window)
-
-    # Determines the trading signal based on the calculated indicators
-    if data['returns'].iloc[-1] > 0 and data['volume_rsi'].iloc[-1] > 50 and data['rsi'].iloc[-1] < 70:
-        signal = 1 # Buy signal  (If the price return is positive, Volume RSI is above 50, and RSI is below 70)
-    elif data['returns'].iloc[-1] < 0 and data['volume_rsi'].iloc[-1] < 50 and data['rsi'].iloc[-1] > 30:
-        signal = -1 # Sell signal  (If the price return is negative, Volume RSI is below 50, and RSI is above 30)
-    else:
-        signal = 0  # Neutral signal (Otherwise)
-
-    print(f"Generated signal: {signal} for {price_history[-1]}, returns: {data['returns'].iloc[-1]}, volume_rsi: {data['volume_rsi'].iloc[-1]}, atr: {data['atr'].iloc[-1]}, rsi: {data['rsi'].iloc[-1]}")
+    returns = indicators.returns
+    volume_rsi = indicators.volume_rsi
+    rsi = indicators.rsi
+
+    signal = int(signal_rule(returns, volume_rsi, rsi))
+    print(f"Generated signal: {signal} for {indicators.last_close}, returns: {returns}, volume_rsi: {volume_rsi}, atr: {indicators.atr}, rsi: {rsi}")
     return signal
 
-def get_latest_price(symbol):  # Fetches the latest closing price for the given symbol.
+def signal_rule(returns, volume_rsi, rsi):
+    # Determines the trading signal based on the calculated indicators, works on scalars or NumPy arrays
+    with np.errstate(invalid='ignore'):
+        buy = (returns > 0) & (volume_rsi > 50) & (rsi < 70)  # Buy signal  (If the price return is positive, Volume RSI is above 50, and RSI is below 70)
+        sell = (returns < 0) & (volume_rsi < 50) & (rsi > 30)  # Sell signal  (If the price return is negative, Volume RSI is below 50, and RSI is above 30)
+    return np.where(buy, 1, np.where(sell, -1, 0))  # Neutral signal (Otherwise)
+
+def generate_batch_signals(batch_symbols):
+    """ Generates signals for many symbols in one vectorized pass over their bar histories.
+    Gives the same signals as generate_signals on each symbol's streaming indicators.
+        Returns:
+            dict: symbol -> trading signal (-1 for sell, 0 for hold, 1 for buy)."""
+    # window x symbol matrices, NaN-padded at the top for symbols that are still warming up
+    closes = np.full((window, len(batch_symbols)), np.nan)
+    volumes = np.full((window, len(batch_symbols)), np.nan)
+    for column, symbol in enumerate(batch_symbols):
+        history = bar_histories[symbol]
+        closes[window - len(history):, column] = history.close
+        volumes[window - len(history):, column] = history.volume
+
+    # The last `window` bars hold window - 1 diffs, as in generate_signals
+    rsi = calculate_rsi_batch(closes, window - 1)[-1]
+    volume_rsi = calculate_volume_rsi_batch(volumes, window - 1)[-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = closes[-1] / closes[-2] - 1
+    ready = np.array([len(bar_histories[symbol]) >= window for symbol in batch_symbols])  # Neutral if not enough data
+    signals = np.where(ready, signal_rule(returns, volume_rsi, rsi), 0)
+    return dict(zip(batch_symbols, signals.tolist()))
+
+def risk_limits_reached(portfolio_value):
+    # Checks the daily loss limit and maximum drawdown, returns (limit reached, current drawdown)
+    global initial_portfolio_value
+    # Initialize initial portfolio value if not set (0 means the portfolio mirror hasn't synced yet, never a baseline)
+    if initial_portfolio_value is None:
+        if portfolio_value <= 0:
+            raise ValueError("Portfolio mirror has not synced yet, no portfolio value to check risk limits against")
+        initial_portfolio_value = portfolio_value
+
+    # Calculate current drawdown
+    drawdown = (initial_portfolio_value - portfolio_value) / initial_portfolio_value
+    return current_daily_loss >= max_daily_loss * initial_portfolio_value or drawdown >= max_drawdown, drawdown
+
+def update_latest_price(symbol, price):
+    # Stores the most recent close seen for the symbol, so trades don't need a REST call for it
+    latest_prices[symbol] = (price, datetime.now())
+
+def get_latest_price(symbol):  # Returns the latest closing price, from the stream cache when it is fresh enough.
+    cached = latest_prices.get(symbol)
+    if cached is not None and datetime.now() - cached[1] <= max_price_age:
+        return cached[0]
+
     try:
-        # Gets the most recent bar data for the symbol
+        # Cache is empty or stale, so get the most recent bar data for the symbol
         bars = api.get_bars(symbol, tradeapi.rest.TimeFrame.Minute, limit=1).df
         latest_price = bars['close'].iloc[-1]
+        update_latest_price(symbol, latest_price)
         return latest_price
     except Exception as e:
         logging.error(f"Error fetching latest price for {symbol}: {e}")
@@ -123,17 +172,11 @@ def cancel_existing_orders(symbol):  # Cancels all open orders for a given symbo
 def execute_trade(symbol, signal, portfolio, cash, portfolio_value):
     # Executes a trade based on the given signal and updates the portfolio.
 
-    global last_log_time, current_daily_loss, initial_portfolio_value
-    # Initialize initial portfolio value if not set
+    global last_log_time, current_daily_loss
     try:
-        if initial_portfolio_value is None:
-            initial_portfolio_value = portfolio_value
-
-        # Calculate current drawdown
-        drawdown = (initial_portfolio_value - portfolio_value) / initial_portfolio_value
-
         # Check daily loss limit and maximum drawdown
-        if current_daily_loss >= max_daily_loss * initial_portfolio_value or drawdown >= max_drawdown:
+        limits_reached, drawdown = risk_limits_reached(portfolio_value)
+        if limits_reached:
             logging.info(f"Risk limits reached. Daily Loss: {current_daily_loss}, Drawdown: {drawdown}. No trades executed.")
             return
 
@@ -164,7 +207,7 @@ def execute_trade(symbol, signal, portfolio, cash, portfolio_value):
                 time_in_force='day'
             )
             active_trades.append(order.id)
-            log_trade(order, 'buy')
+            fill = order_tracker.track(order.id)  # Logged to the trade log when the fill arrives
 
             # Set global stop loss and take profit levels
             set_stop_loss_take_profit(symbol, latest_price)
@@ -177,7 +220,7 @@ def execute_trade(symbol, signal, portfolio, cash, portfolio_value):
             # Cancel any existing stop loss or take profit orders
             cancel_existing_orders(symbol)
 
-            # Fetch updated portfolio data to get accurate available quantity
+            # Re-read the local mirror in case a fill arrived since the snapshot was taken
             cash, portfolio, portfolio_value = get_portfolio()
 
             # Sell the entire available quantity
@@ -190,63 +233,165 @@ def execute_trade(symbol, signal, portfolio, cash, portfolio_value):
                 time_in_force='day'
             )
             active_trades.append(order.id)
-            log_trade(order, 'sell')
-
-        # Update current daily loss
-        current_daily_loss += quantity * latest_price if signal == -1 else -quantity * latest_price
-
-        # Log portfolio value every 5 minutes
-        current_time = datetime.now()
-        if (current_time - last_log_time).total_seconds() >= 300:
-            log_portfolio_value()
-            last_log_time = current_time
+            fill = order_tracker.track(order.id)
+
+        with risk_lock:
+            # Update current daily loss
+            current_daily_loss += quantity * latest_price if signal == -1 else -quantity * latest_price
+
+            # Log portfolio value every portfolio_log_interval
+            current_time = datetime.now()
+            log_due = current_time - last_log_time >= portfolio_log_interval
+            if log_due:
+                last_log_time = current_time
+        if log_due:
+            log_portfolio_value(portfolio_state.snapshot())  # Local mirror, no account or positions REST calls
+            generate_live_report()  # O(1) from the running metrics, no CSV re-read
+        return fill  # Future resolving with the final order
 
     except tradeapi.rest.APIError as e:
         logging.error(f"API Error executing trade for {symbol}: {e}")
     except Exception as e:
         logging.error(f"Error executing trade for {symbol}: {e}")
 
-async def on_minute_bars(bar):
-    """ Handles new minute bar data and updates price, volume, high, and low histories.
-    Generates and executes trading signals based on updated data."""
-    symbol = bar.symbol # Get the symbol for the bar
-    # Append the latest bar data to the historical lists
-    price_histories[symbol].append(bar.close)
-    volume_histories[symbol].append(bar.volume)
-    high_histories[symbol].append(bar.high)
-    low_histories[symbol].append(bar.low)
+def record_bar(bar):
+    # Appends the latest bar data to the fixed-size history (oldest bar is overwritten once full) and updates indicators and caches
+    symbol = bar.symbol
+    bar_histories[symbol].append(bar.close, bar.volume, bar.high, bar.low)
+    indicator_engines[symbol].update(bar.close, bar.volume, bar.high, bar.low)
+    update_latest_price(symbol, bar.close)
+    portfolio_state.mark(symbol, bar.close)
     print(f"Received new bar data for {symbol}: {bar.close}")
 
-    # Maintain a fixed-size window of historical data
-    if len(price_histories[symbol]) > window:
-        price_histories[symbol].pop(0)
-        volume_histories[symbol].pop(0)
-        high_histories[symbol].pop(0)
-        low_histories[symbol].pop(0)
-
-    # Generate a trading signal based on updated historical data
-    signal = generate_signals(price_histories[symbol], volume_histories[symbol], high_histories[symbol], low_histories[symbol])
-    if signal is not None:
-        cash, portfolio, portfolio_value = get_portfolio()  # Get updated portfolio and cash information
-        execute_trade(symbol, signal, portfolio, cash, portfolio_value)  # Execute the trade based on the generated signal
-
+def check_exit_levels(symbol, portfolio, cash, portfolio_value):
     # Check for stop loss or take profit triggers
     if symbol in stop_loss_levels and symbol in take_profit_levels:
         latest_price = get_latest_price(symbol)
         if latest_price is not None:
             if latest_price <= stop_loss_levels[symbol] or latest_price >= take_profit_levels[symbol]:
-                execute_trade(symbol, -1, portfolio, cash, portfolio_value)
+                order_executor.submit(symbol, execute_trade, symbol, -1, portfolio, cash, portfolio_value)
+
+async def on_minute_bars(bar):
+    """ Handles new minute bar data and updates the symbol's bar history and indicators.
+    Generates and executes trading signals based on updated data."""
+    symbol = bar.symbol # Get the symbol for the bar
+    record_bar(bar)
 
-async def run_momentum_strategy():
+    # Generate a trading signal based on updated historical data
+    signal = generate_signals(indicator_engines[symbol])
+    cash, portfolio, portfolio_value = get_portfolio()  # Local snapshot, reconciled with the broker every few minutes in the background
+    if signal:
+        # Hand the trade to the order workers so bar intake never waits on the broker
+        order_executor.submit(symbol, execute_trade, symbol, signal, portfolio, cash, portfolio_value)
+
+    check_exit_levels(symbol, portfolio, cash, portfolio_value)
+
+def evaluate_batch():
+    """ Evaluates every symbol collected for the current minute at once:
+    one vectorized signal pass, one portfolio snapshot and one risk check for the whole universe."""
+    batch_symbols = list(pending_batch)
+    pending_batch.clear()
+    batch_complete.clear()
+    if not batch_symbols:
+        return
+
+    missing = len(symbols) - len(batch_symbols)
+    if missing:
+        logging.info(f"Evaluating batch of {len(batch_symbols)} symbols, {missing} did not report within {batch_grace_period}s")
+
+    cash, portfolio, portfolio_value = get_portfolio()
+    if portfolio_value <= 0:
+        logging.info(f"Portfolio mirror has not synced yet, skipping batch of {len(batch_symbols)} symbols")
+        return
+
+    signals = generate_batch_signals(batch_symbols)
     try:
+        limits_reached, drawdown = risk_limits_reached(portfolio_value)
+        if limits_reached:
+            logging.info(f"Risk limits reached. Daily Loss: {current_daily_loss}, Drawdown: {drawdown}. No trades executed.")
+        else:
+            for symbol, signal in signals.items():
+                if signal:
+                    order_executor.submit(symbol, execute_trade, symbol, signal, portfolio, cash, portfolio_value)
+    except Exception as e:
+        # No new entries without a risk check, but the exit checks below still run
+        logging.error(f"Error checking risk limits for batch: {e}")
+
+    for symbol in batch_symbols:
+        check_exit_levels(symbol, portfolio, cash, portfolio_value)
+
+async def flush_batch_after_grace():
+    # Waits until every symbol has reported or the grace period is over, then evaluates the minute
+    global batch_task
+    try:
+        await asyncio.wait_for(batch_complete.wait(), timeout=batch_grace_period)
+    except asyncio.TimeoutError:
+        pass
+    batch_task = None
+    evaluate_batch()
+
+async def on_minute_bars_batched(bar):
+    """ Batch mode bar handler: collects the bars for one minute across the universe
+    and evaluates them together once all symbols are in or the grace period runs out."""
+    global batch_task
+    symbol = bar.symbol
+    if symbol in pending_batch:
+        # A new minute started before the previous batch was evaluated, flush it first
+        if batch_task is not None:
+            batch_task.cancel()
+            batch_task = None
+        evaluate_batch()
+
+    record_bar(bar)
+    pending_batch[symbol] = bar
+    if len(pending_batch) == len(symbols):
+        batch_complete.set()
+    if batch_task is None:
+        batch_task = asyncio.ensure_future(flush_batch_after_grace())
+
+async def log_stats_periodically():
+    # Logs ingestion and broker load every stats_log_interval, so overload shows up even when no trades go out
+    while True:
+        await asyncio.sleep(stats_log_interval.total_seconds())
+        if bar_queue is not None:
+            logging.info(f"Bar queue stats: {bar_queue.stats()}")
+        logging.info(f"Broker request stats: {broker_scheduler.stats()}")
+        logging.info(f"Market cache stats: {market_cache.stats()}")
+
+async def run_momentum_strategy(batch_mode=False, queue_policy=PROCESS_ALL, max_bar_age=None):
+    """ Subscribes to the data streams and runs the strategy.
+    With batch_mode=True, signals are evaluated once per minute for all symbols together instead of bar by bar.
+    queue_policy controls bars that back up while the handler is busy: 'all' handles every bar,
+    'latest' keeps only the newest bar per symbol and 'max_age' drops bars older than max_bar_age seconds
+    (by the bar's timestamp or its time in the queue, whichever is later)."""
+    global bar_queue
+    reconcile_task = None
+    stats_task = asyncio.ensure_future(log_stats_periodically())
+    order_reconcile_task = asyncio.ensure_future(order_tracker.run_reconciler(api, order_reconcile_interval.total_seconds()))  # Missed fills, e.g. after a reconnect
+    try:
+        # Seed the local portfolio mirror once and keep it current from our own fills
+        portfolio_state.sync()
+        reconcile_task = asyncio.ensure_future(portfolio_state.run_reconciler())  # Periodic broker check, off the bar handlers
+        order_tracker.add_listener(portfolio_state.on_trade_update)
+        conn.subscribe_trade_updates(order_tracker.on_trade_update)
+
         # Subscribe to minute bars for each symbol individually
+        # Bars go through the ingestion queue so the stream reader never waits on the strategy
+        handler = on_minute_bars_batched if batch_mode else on_minute_bars
+        bar_queue = BarIngestQueue(handler, queue_policy, max_bar_age, warn_depth=2 * len(symbols))
+        bar_queue.start()
         for symbol in symbols:
-            conn.subscribe_bars(on_minute_bars, symbol)
+            conn.subscribe_bars(bar_queue.put, symbol)
 
         # Start the WebSocket connection to receive real-time data
         await conn._run_forever()
     except Exception as e:
         logging.error(f"Error running strategy: {e}")
+    finally:
+        if reconcile_task is not None:
+            reconcile_task.cancel()
+        stats_task.cancel()
+        order_reconcile_task.cancel()
 
 async def main():
     print("Strategy started")
@@ -255,6 +400,7 @@ async def main():
 if __name__ == "__main__":
     initialize_trade_log()
     initialize_performance_log()
+    seed_performance_accumulator()
     loop = asyncio.get_event_loop()  # Create and start the event loop
     loop.create_task(main())  # Schedule the main function
     loop.run_forever()  # Run the event loop
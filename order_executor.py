@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+class OrderExecutor:
+    """Runs blocking broker work (order submits, cancels, trade logging) on a bounded thread pool
+    so the asyncio bar handler never waits on HTTP.
+    Work for the same key (symbol) runs in submission order; different symbols run in parallel."""
+
+    def __init__(self, max_workers=4, max_pending=100):
+        self.max_pending = max_pending
+        self.pending = 0  # Intents accepted but not finished yet
+        self.rejected = 0  # Intents dropped because the queue was full
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='order-worker')
+        self._tails = {}  # key -> last task queued for that key
+
+    def submit(self, key, func, *args, callback=None):
+        """ Queues func(*args) and returns an asyncio Task straight away, or None if the queue is full.
+        callback(task) is called when the work finishes; task.result() holds func's return value."""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            logging.warning(f"Order queue full ({self.pending} pending), dropping intent for {key}")
+            return None
+
+        task = asyncio.ensure_future(self._run(self._tails.get(key), func, args))
+        self._tails[key] = task
+        self.pending += 1
+        task.add_done_callback(lambda finished: self._on_done(key, finished, callback))
+        return task
+
+    async def _run(self, previous, func, args):
+        if previous is not None:
+            await asyncio.wait([previous])  # Keep per-symbol order, whether or not the previous intent failed
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, func, *args)
+
+    def _on_done(self, key, task, callback):
+        self.pending -= 1
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Order work for {key} failed: {task.exception()}")
+        if callback is not None:
+            try:
+                callback(task)
+            except Exception as e:
+                logging.error(f"Error in order callback for {key}: {e}")
+
+    async def drain(self):
+        # Waits for everything queued so far, e.g. before shutting down
+        tasks = list(self._tails.values())
+        if tasks:
+            await asyncio.wait(tasks)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
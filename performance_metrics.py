@@ -4,12 +4,24 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import alpaca_trade_api as tradeapi
+from request_scheduler import ScheduledAPI, broker_scheduler
+from log_store import ColumnarLogStore, PERFORMANCE_LOG_SCHEMA
+from market_cache import get_account, get_positions, get_daily_bar
+from report_engine import PerformanceAccumulator, build_report
+from chart_renderer import render_charts
 
 # Path to the performance metrics log file
 PERFORMANCE_LOG_FILE = 'logs/performance_log.csv'
 REPORT_FILE = 'logs/trading_strategy_report.txt'
+REPORT_JSON_FILE = 'logs/trading_strategy_report.json'
+REPORT_CHUNK_ROWS = 100000  # Rows of the CSV log read at a time when generating a report
+CHART_DIR = 'logs'
+CHARTS_IN_BACKGROUND = True  # Render charts in a separate process so the report text is ready first
+PERFORMANCE_STORE_DIR = 'logs/performance_store'  # Columnar performance log (optional backend)
+PERFORMANCE_LOG_BACKEND = 'csv'  # 'csv' or 'columnar'
+BENCHMARK_SYMBOL = 'SPY'  # Daily high/low/close/volume recorded next to the portfolio value
+_performance_store = None
 
 load_dotenv()
 
@@ -18,7 +30,8 @@ ALPACA_API_KEY = os.environ.get('ALPACA_API_KEY')
 ALPACA_SECRET_KEY = os.environ.get('ALPACA_SECRET_KEY')
 BASE_URL = 'https://paper-api.alpaca.markets'
 
-api = tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2')
+# Every REST call goes through the shared rate limiter (orders first, duplicate reads coalesced)
+api = ScheduledAPI(tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2'), broker_scheduler)
 
 def initialize_performance_log():
     if not os.path.exists(PERFORMANCE_LOG_FILE):  # Checks if the log file exists
@@ -27,26 +40,46 @@ def initialize_performance_log():
             writer = csv.writer(file)
             writer.writerow(['Timestamp', 'Portfolio Value', 'Cash Balance', 'Positions', 'Daily High', 'Daily Low', 'Daily Close', 'Volume'])
 
-def log_portfolio_value():
+def get_performance_store():
+    # Opens the columnar performance log on first use
+    global _performance_store
+    if _performance_store is None:
+        _performance_store = ColumnarLogStore(PERFORMANCE_STORE_DIR, PERFORMANCE_LOG_SCHEMA)
+    return _performance_store
+
+def log_portfolio_value(snapshot=None):
+    """ Appends the portfolio value, cash, positions and the benchmark's daily bar to the performance log.
+    snapshot is (cash, {symbol: quantity}, portfolio value) from the strategy's local portfolio mirror, which costs
+    no REST calls; without it the account and positions are read from the broker (through the TTL cache)."""
     try:
-        account = api.get_account()
-        portfolio_value = account.equity
-        cash_balance = account.cash
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-        # Get positions
-        positions = api.list_positions()
-        positions_str = '; '.join([f"{position.symbol}: {position.qty}" for position in positions])
-
-        bars = api.get_bars('SPY', tradeapi.rest.TimeFrame.Day, limit=1).df
+        if snapshot is not None:
+            cash_balance, positions, portfolio_value = snapshot
+            positions_str = '; '.join([f"{symbol}: {quantity}" for symbol, quantity in positions.items()])
+        else:
+            account = get_account(api)
+            portfolio_value = account.equity
+            cash_balance = account.cash
+
+            # Get positions
+            positions = get_positions(api)
+            positions_str = '; '.join([f"{position.symbol}: {position.qty}" for position in positions])
+
+        # The benchmark bar comes from the shared TTL cache, it barely moves within the day
+        bars = get_daily_bar(api, BENCHMARK_SYMBOL)
         daily_high = bars['high'].iloc[0]
         daily_low = bars['low'].iloc[0]
         daily_close = bars['close'].iloc[0]
         volume = bars['volume'].iloc[0]
 
-        with open(PERFORMANCE_LOG_FILE, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([timestamp, portfolio_value, cash_balance, positions_str, daily_high, daily_low, daily_close, volume])
+        row = [timestamp, portfolio_value, cash_balance, positions_str, daily_high, daily_low, daily_close, volume]
+        performance_accumulator.update(timestamp, portfolio_value)
+        if PERFORMANCE_LOG_BACKEND == 'columnar':
+            get_performance_store().append([row])
+        else:
+            with open(PERFORMANCE_LOG_FILE, mode='a', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(row)
 
         print(f"Logged portfolio value at {timestamp}")
     except Exception as e:
@@ -94,96 +127,53 @@ def period_metrics(df, period):
 
     return initial_value, final_value, cumulative_return, sharpe_ratio, max_drawdown
 
-def generate_report():
-    if not os.path.exists(PERFORMANCE_LOG_FILE):
-        raise FileNotFoundError(f"{PERFORMANCE_LOG_FILE} not found.")
-
-    df = pd.read_csv(PERFORMANCE_LOG_FILE, parse_dates=['Timestamp'], index_col='Timestamp')
-
-    start_time = df.index.min()
-    end_time = df.index.max()
-    duration = end_time - start_time
-
-    # Ensure sufficient data points
-    if len(df) < 2:
-        raise ValueError("Not enough data to generate report")
-
-    # Metrics for each period
-    daily_initial, daily_final, daily_cum_return, daily_sharpe, daily_drawdown = period_metrics(df, 'D')
-    weekly_initial, weekly_final, weekly_cum_return, weekly_sharpe, weekly_drawdown = period_metrics(df, 'W')
-    monthly_initial, monthly_final, monthly_cum_return, monthly_sharpe, monthly_drawdown = period_metrics(df, 'MS')
-    yearly_initial, yearly_final, yearly_cum_return, yearly_sharpe, yearly_drawdown = period_metrics(df, 'YS')
-
-    with open(REPORT_FILE, 'w') as report:
-        report.write(f"Trading Strategy Report\n")
-        report.write(f"{'='*23}\n\n")
-        
-        report.write(f"Running Period:\n")
-        report.write(f"{'-'*16}\n")
-        report.write(f"Start Time: {start_time}\n")
-        report.write(f"End Time: {end_time}\n")
-        report.write(f"Total Duration: {duration}\n\n")
-
-        report.write(f"Daily Performance:\n")
-        report.write(f"{'-'*19}\n")
-        report.write(f"Initial Portfolio Value: {daily_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {daily_final:.2f}\n")
-        report.write(f"Cumulative Return: {daily_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {daily_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {daily_drawdown:.2%}\n\n")
-
-        report.write(f"Weekly Performance:\n")
-        report.write(f"{'-'*20}\n")
-        report.write(f"Initial Portfolio Value: {weekly_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {weekly_final:.2f}\n")
-        report.write(f"Cumulative Return: {weekly_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {weekly_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {weekly_drawdown:.2%}\n\n")
-
-        report.write(f"Monthly Performance:\n")
-        report.write(f"{'-'*21}\n")
-        report.write(f"Initial Portfolio Value: {monthly_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {monthly_final:.2f}\n")
-        report.write(f"Cumulative Return: {monthly_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {monthly_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {monthly_drawdown:.2%}\n\n")
-
-        report.write(f"Yearly Performance:\n")
-        report.write(f"{'-'*20}\n")
-        report.write(f"Initial Portfolio Value: {yearly_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {yearly_final:.2f}\n")
-        report.write(f"Cumulative Return: {yearly_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {yearly_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {yearly_drawdown:.2%}\n\n")
-
-        report.write(f"Note: Sharpe Ratio is displayed as 'Insufficient data' when there are not enough data points to calculate a meaningful value or if returns are constant.\n\n")
-
-    # Ensure 'Cumulative Return' exists in the DataFrame for plotting
-    df['Daily Return'] = df['Portfolio Value'].pct_change()
-    df['Cumulative Return'] = (1 + df['Daily Return']).cumprod() - 1
-    generate_charts(df)
-
-
-
-def generate_charts(df):
-    plt.figure(figsize=(10, 6))
-    df['Cumulative Return'].plot()
-    plt.title('Cumulative Return')
-    plt.savefig('logs/cumulative_return.png')
-    plt.close()
+performance_accumulator = PerformanceAccumulator()  # Fed by log_portfolio_value
 
-    plt.figure(figsize=(10, 6))
-    df['Daily Return'].plot()
-    plt.title('Daily Return')
-    plt.savefig('logs/daily_return.png')
-    plt.close()
+def seed_performance_accumulator():
+    # Replays the existing performance log once at startup so live reports cover the whole history
+    try:
+        for timestamps, values in iter_portfolio_values():
+            performance_accumulator.update_many(timestamps, values)
+    except FileNotFoundError:
+        return
+
+def generate_live_report(path=REPORT_FILE):
+    # Writes the report from the running accumulator, without reading the performance log
+    if performance_accumulator.start_time is None:
+        return  # Nothing logged yet
+    performance_accumulator.write_report(path, REPORT_JSON_FILE)
+
+def iter_portfolio_values(start=None, end=None, chunk_rows=REPORT_CHUNK_ROWS):
+    """ Yields (timestamps, portfolio values) NumPy arrays from the configured backend, chunk_rows CSV rows
+    (or one date partition) at a time. Only the two columns the report needs are parsed."""
+    if PERFORMANCE_LOG_BACKEND == 'columnar':
+        for frame in get_performance_store().iter_read(start, end, columns=['Timestamp', 'Portfolio Value']):
+            yield frame['Timestamp'].to_numpy(), frame['Portfolio Value'].to_numpy(dtype=np.float64)
+        return
 
-    df['Drawdown'] = df['Portfolio Value'] / df['Portfolio Value'].cummax() - 1
-    plt.figure(figsize=(10, 6))
-    df['Drawdown'].plot()
-    plt.title('Drawdown')
-    plt.savefig('logs/drawdown.png')
-    plt.close()
+    if not os.path.exists(PERFORMANCE_LOG_FILE):
+        raise FileNotFoundError(f"{PERFORMANCE_LOG_FILE} not found.")
+    start = np.datetime64(pd.Timestamp(start)) if start is not None else None
+    end = np.datetime64(pd.Timestamp(end)) if end is not None else None
+    for chunk in pd.read_csv(PERFORMANCE_LOG_FILE, usecols=['Timestamp', 'Portfolio Value'], chunksize=chunk_rows):
+        timestamps = pd.to_datetime(chunk['Timestamp']).to_numpy()
+        values = pd.to_numeric(chunk['Portfolio Value'], errors='coerce').to_numpy(dtype=np.float64)
+        mask = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            mask &= timestamps >= start
+        if end is not None:
+            mask &= timestamps <= end
+        yield timestamps[mask], values[mask]
+
+def generate_report(start=None, end=None, chunk_rows=REPORT_CHUNK_ROWS, background_charts=CHARTS_IN_BACKGROUND):
+    """ Writes the text and JSON reports and the charts in one pass over the performance log.
+    The log is streamed chunk_rows at a time and every period is updated together, see report_engine."""
+    _, chart_data = build_report(iter_portfolio_values(start, end, chunk_rows), REPORT_FILE, REPORT_JSON_FILE)
+    return generate_charts(chart_data, background_charts)  # Chart process when rendering in the background
+
+def generate_charts(series, background=False):
+    # Charts of the bounded series built by report_engine.ChartSeries; unchanged charts are skipped, see chart_renderer
+    return render_charts(series, CHART_DIR, background=background)
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from market_cache import market_cache, ACCOUNT_TTL
+
+class PortfolioState:
+    """In-process mirror of the Alpaca account: cash, position quantities and portfolio value.
+    Seeded from the REST API once, kept current from fills on the trade-updates stream and
+    reconciled with the broker every `reconcile_interval` by run_reconciler, so reading state costs no HTTP calls."""
+
+    def __init__(self, api, reconcile_interval=timedelta(minutes=5)):
+        self.api = api
+        self.reconcile_interval = reconcile_interval
+        self.cash = 0.0
+        self.positions = {}  # symbol -> quantity
+        self.prices = {}  # symbol -> last known price, used to value the positions
+        self.last_sync = None  # Last successful sync
+        self.last_attempt = None  # Last sync attempt, failed ones included, so a broker outage isn't retried on every read
+        self._lock = threading.Lock()  # Fills and reads can come from different threads
+
+    def sync(self):
+        # Replaces the local state with the broker's view (account + positions)
+        self.last_attempt = datetime.now()
+        try:
+            account = self.api.get_account()
+            positions = self.api.list_positions()
+        except Exception as e:
+            logging.error(f"Error syncing portfolio with broker: {e}")
+            return False
+        # Share the fresh snapshot with other readers (e.g. the performance log)
+        market_cache.put('account', account, ACCOUNT_TTL)
+        market_cache.put('positions', positions, ACCOUNT_TTL)
+
+        with self._lock:
+            self.cash = float(account.cash)
+            self.positions = {position.symbol: float(position.qty) for position in positions}
+            for position in positions:
+                self.prices[position.symbol] = float(position.current_price)
+            self.last_sync = datetime.now()
+        return True
+
+    def needs_reconcile(self):
+        return self.last_attempt is None or datetime.now() - self.last_attempt >= self.reconcile_interval
+
+    async def run_reconciler(self):
+        """ Syncs with the broker every reconcile_interval (counted from the last attempt, so failures back off too).
+        The REST calls run on a worker thread, the event loop never waits on them."""
+        loop = asyncio.get_event_loop()
+        while True:
+            if self.needs_reconcile():
+                await loop.run_in_executor(None, self.sync)
+            elapsed = datetime.now() - self.last_attempt
+            await asyncio.sleep(max((self.reconcile_interval - elapsed).total_seconds(), 0))
+
+    def snapshot(self):
+        """ Returns (cash, portfolio, portfolio_value) like get_portfolio() did, from local state only (never calls the broker).
+        Returns (0, {}, 0) if the broker has never been reached."""
+        with self._lock:
+            if self.last_sync is None:
+                return 0, {}, 0
+            portfolio_value = self.cash + sum(quantity * self.prices.get(symbol, 0) for symbol, quantity in self.positions.items())
+            return self.cash, dict(self.positions), portfolio_value
+
+    def mark(self, symbol, price):
+        # Updates the price used to value a position (fed from the bar stream)
+        with self._lock:
+            self.prices[symbol] = price
+
+    def apply_fill(self, symbol, side, quantity, price, position_qty=None):
+        """ Applies one execution to cash and positions.
+        position_qty is the broker's resulting position size when known, which avoids drift from rounding."""
+        with self._lock:
+            signed_quantity = quantity if side == 'buy' else -quantity
+            self.cash -= signed_quantity * price
+            if position_qty is None:
+                position_qty = self.positions.get(symbol, 0) + signed_quantity
+            if position_qty > 0:
+                self.positions[symbol] = position_qty
+            else:
+                self.positions.pop(symbol, None)
+            self.prices[symbol] = price
+        # Cached account snapshots are out of date after a fill
+        market_cache.invalidate('account')
+        market_cache.invalidate('positions')
+
+    async def on_trade_update(self, data):
+        # Handler for Stream.subscribe_trade_updates, applies fill and partial_fill events
+        if data.event not in ('fill', 'partial_fill'):
+            return
+        try:
+            order = data.order
+            position_qty = getattr(data, 'position_qty', None)
+            self.apply_fill(order['symbol'], order['side'], float(data.qty), float(data.price),
+                            float(position_qty) if position_qty is not None else None)
+        except Exception as e:
+            logging.error(f"Error applying trade update to portfolio: {e}")
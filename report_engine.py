@@ -0,0 +1,265 @@
+import json
+import logging
+import numpy as np
+import pandas as pd
+from chart_renderer import CHARTS, CHART_MAX_POINTS, downsample
+
+"""Single-pass performance report engine shared by performance_metrics.py and the backtest copy in tests/.
+Portfolio values are streamed in (one row or one chunk at a time) and every report period is updated together,
+so a report never needs the whole log in memory or a separate resample per period."""
+
+def _days(timestamps):
+    return timestamps.astype('datetime64[D]').astype(np.int64)
+
+# Report periods, the resample alias each one matches and how a datetime64 array maps to bucket numbers
+# (consecutive buckets differ by exactly 1, so gaps can be counted)
+REPORT_PERIODS = {
+    'Daily': ('D', lambda timestamps: _days(timestamps)),
+    'Weekly': ('W', lambda timestamps: (_days(timestamps) + 3) // 7),  # Monday to Sunday; 1970-01-01 was a Thursday
+    'Monthly': ('MS', lambda timestamps: timestamps.astype('datetime64[M]').astype(np.int64)),
+    'Yearly': ('YS', lambda timestamps: timestamps.astype('datetime64[Y]').astype(np.int64))
+}
+
+class _RunningSeries:
+    # Welford mean/variance of returns plus peak and max drawdown for one resampled value series
+    def __init__(self):
+        self.count = 0  # Returns seen
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.first = None
+        self.last = None
+        self.peak = None
+        self.max_drawdown = 0.0
+
+    def copy(self):
+        clone = _RunningSeries()
+        clone.__dict__.update(self.__dict__)
+        return clone
+
+    def add(self, value, empty_before=0):
+        """ Adds the closing value of one bucket. empty_before is the number of buckets without data since the previous one;
+        they carry the previous value forward (zero returns), as pct_change pads the NaNs left by resample."""
+        if self.last is None:
+            self.first = self.peak = value
+        else:
+            for _ in range(empty_before):
+                self._add_return(0.0)
+            self._add_return(value / self.last - 1)
+        self.last = value
+        self.peak = max(self.peak, value)
+        self.max_drawdown = min(self.max_drawdown, value / self.peak - 1)
+
+    def _add_return(self, daily_return):
+        self.count += 1
+        delta = daily_return - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (daily_return - self.mean)
+
+    def metrics(self):
+        # Same tuple as period_metrics: initial value, final value, cumulative return, Sharpe ratio, max drawdown
+        std_return = np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+        if std_return == 0 or np.isnan(std_return):
+            sharpe_ratio = 'Insufficient data'
+        else:
+            # Sharpe ratio, assuming 252 trading days in a year
+            sharpe_ratio = (self.mean / std_return) * np.sqrt(252)
+        return self.first, self.last, (self.last / self.first) - 1, sharpe_ratio, self.max_drawdown
+
+class PerformanceAccumulator:
+    """Keeps daily, weekly, monthly and yearly performance metrics up to date as portfolio values come in.
+    update() is O(1) and update_many() handles a whole chunk with NumPy, touching Python only once per bucket boundary.
+    Gives the same numbers as period_metrics on the full log."""
+
+    def __init__(self, periods=REPORT_PERIODS):
+        self.periods = periods
+        self.rows = 0
+        self.start_time = None
+        self.end_time = None
+        self._series = {name: _RunningSeries() for name in periods}  # Completed buckets only
+        self._bucket = {name: None for name in periods}  # Bucket number currently open
+        self._previous_bucket = {name: None for name in periods}  # Last completed bucket number
+        self._bucket_value = {name: None for name in periods}  # Latest value in the open bucket
+
+    def update(self, timestamp, portfolio_value):
+        self.update_many(np.array([pd.Timestamp(timestamp).to_datetime64()]), np.array([float(portfolio_value)]))
+
+    def update_many(self, timestamps, values):
+        # Adds a time-ordered chunk of (timestamp, portfolio value) rows; rows older than what was already seen are skipped
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]')
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~np.isnan(values) & ~np.isnat(timestamps)
+        ticks = timestamps.astype(np.int64)
+        latest = np.maximum.accumulate(np.where(keep, ticks, np.iinfo(np.int64).min))  # Newest timestamp kept so far
+        if self.end_time is not None:
+            latest = np.maximum(latest, self.end_time.astype(np.int64))
+        keep &= ticks >= latest
+        if not keep.all():
+            logging.warning(f"Ignoring {int((~keep).sum())} missing or out-of-order portfolio values")
+            timestamps, values = timestamps[keep], values[keep]
+        if len(values) == 0:
+            return
+
+        if self.start_time is None:
+            self.start_time = timestamps[0]
+        self.end_time = timestamps[-1]
+        self.rows += len(values)
+
+        for name, (_, bucket_of) in self.periods.items():
+            buckets = bucket_of(timestamps)
+            last_rows = np.flatnonzero(np.diff(buckets))  # Last row of each bucket that closes inside this chunk
+            for row in last_rows:
+                self._set_open(name, buckets[row], values[row])
+                self._close_bucket(name)
+            self._set_open(name, buckets[-1], values[-1])
+
+    def _set_open(self, name, bucket, value):
+        if self._bucket[name] is not None and bucket != self._bucket[name]:
+            self._close_bucket(name)
+        self._bucket[name] = int(bucket)
+        self._bucket_value[name] = float(value)
+
+    def _close_bucket(self, name):
+        previous = self._previous_bucket[name]
+        empty_before = self._bucket[name] - previous - 1 if previous is not None else 0
+        self._series[name].add(self._bucket_value[name], empty_before)
+        self._previous_bucket[name] = self._bucket[name]
+        self._bucket[name] = None
+
+    def metrics(self, name):
+        # period_metrics tuple for one period, counting the bucket still open as the last point
+        series = self._series[name].copy()
+        if self._bucket[name] is not None:
+            previous = self._previous_bucket[name]
+            series.add(self._bucket_value[name], self._bucket[name] - previous - 1 if previous is not None else 0)
+        return series.metrics()
+
+    def results(self):
+        return {name: self.metrics(name) for name in self.periods}
+
+    def write_report(self, path, json_path=None):
+        # Writes the text report, and the same numbers as JSON when json_path is given
+        if self.start_time is None:
+            raise ValueError("Not enough data to generate report")
+        results = self.results()
+        start_time, end_time = pd.Timestamp(self.start_time), pd.Timestamp(self.end_time)
+        write_report(results, start_time, end_time, path)
+        if json_path is not None:
+            write_report_json(results, start_time, end_time, json_path)
+
+def write_report(results, start_time, end_time, path):
+    """ Writes the text report. results maps a period name ('Daily', 'Weekly', ...) to
+        (initial value, final value, cumulative return, Sharpe ratio, max drawdown) as returned by period_metrics."""
+    with open(path, 'w') as report:
+        report.write(f"Trading Strategy Report\n")
+        report.write(f"{'='*23}\n\n")
+
+        report.write(f"Running Period:\n")
+        report.write(f"{'-'*16}\n")
+        report.write(f"Start Time: {start_time}\n")
+        report.write(f"End Time: {end_time}\n")
+        report.write(f"Total Duration: {end_time - start_time}\n\n")
+
+        for name, (initial, final, cum_return, sharpe, drawdown) in results.items():
+            heading = f"{name} Performance:"
+            report.write(f"{heading}\n")
+            report.write(f"{'-'*(len(heading) + 1)}\n")
+            report.write(f"Initial Portfolio Value: {initial:.2f}\n")
+            report.write(f"Final Portfolio Value: {final:.2f}\n")
+            report.write(f"Cumulative Return: {cum_return:.2%}\n")
+            report.write(f"Sharpe Ratio: {sharpe} (if applicable)\n")
+            report.write(f"Max Drawdown: {drawdown:.2%}\n\n")
+
+        report.write(f"Note: Sharpe Ratio is displayed as 'Insufficient data' when there are not enough data points to calculate a meaningful value or if returns are constant.\n\n")
+
+def write_report_json(results, start_time, end_time, path):
+    # Machine-readable version of the text report; sharpe_ratio is null when there isn't enough data
+    report = {
+        'start_time': str(start_time),
+        'end_time': str(end_time),
+        'duration_seconds': (end_time - start_time).total_seconds(),
+        'periods': {}
+    }
+    for name, (initial, final, cum_return, sharpe, drawdown) in results.items():
+        report['periods'][name.lower()] = {
+            'initial_value': float(initial),
+            'final_value': float(final),
+            'cumulative_return': float(cum_return),
+            'sharpe_ratio': None if isinstance(sharpe, str) else float(sharpe),
+            'max_drawdown': float(drawdown)
+        }
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+class ChartSeries:
+    """Builds the chart series (daily return, cumulative return, drawdown) chunk by chunk in bounded memory.
+    Each chunk is reduced with LTTB as it arrives, and the kept points are reduced again whenever they exceed
+    twice max_points, so memory stays O(max_points) however long the log is. The running first value,
+    peak and last value carry the cumulative return, drawdown and daily return across chunks."""
+
+    def __init__(self, max_points=CHART_MAX_POINTS):
+        self.max_points = max_points
+        self.first = None
+        self.peak = None
+        self.last = None
+        self._points = {column: ([], []) for column in CHARTS}  # column -> (timestamp arrays, value arrays) kept so far
+        self._kept = {column: 0 for column in CHARTS}
+
+    def update(self, timestamps, values):
+        timestamps = np.asarray(timestamps).astype('datetime64[ns]')
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        timestamps, values = timestamps[valid], values[valid]
+        if len(values) == 0:
+            return
+        if self.first is None:
+            self.first = self.peak = values[0]
+
+        previous = np.empty(len(values))
+        previous[0] = np.nan if self.last is None else self.last
+        previous[1:] = values[:-1]
+        peaks = np.maximum.accumulate(np.maximum(values, self.peak))
+        self._add('Daily Return', timestamps, values / previous - 1)
+        self._add('Cumulative Return', timestamps, values / self.first - 1)
+        self._add('Drawdown', timestamps, values / peaks - 1)
+        self.peak = peaks[-1]
+        self.last = values[-1]
+
+    def _add(self, column, timestamps, values):
+        kept_timestamps, kept_values = self._points[column]
+        timestamps, values = downsample(timestamps, values, self.max_points)
+        kept_timestamps.append(timestamps)
+        kept_values.append(values)
+        self._kept[column] += len(values)
+        if self._kept[column] > 2 * self.max_points:
+            self._compact(column)
+
+    def _compact(self, column):
+        kept_timestamps, kept_values = self._points[column]
+        timestamps, values = downsample(np.concatenate(kept_timestamps), np.concatenate(kept_values), self.max_points)
+        self._points[column] = ([timestamps], [values])
+        self._kept[column] = len(values)
+
+    def series(self):
+        # {column: (timestamps, values)} with at most max_points points each, as render_charts takes them
+        result = {}
+        for column in CHARTS:
+            self._compact(column)
+            kept_timestamps, kept_values = self._points[column]
+            result[column] = (kept_timestamps[0], kept_values[0])
+        return result
+
+def build_report(chunks, report_path, json_path=None, charts=True):
+    """ Streams (timestamps, portfolio values) chunks through one PerformanceAccumulator and writes the text and JSON reports.
+    Returns (accumulator, chart series); the chart series are built chunk by chunk in bounded memory (see ChartSeries),
+    None with charts=False."""
+    accumulator = PerformanceAccumulator()
+    chart_series = ChartSeries() if charts else None
+    for timestamps, values in chunks:
+        accumulator.update_many(timestamps, values)
+        if chart_series is not None:
+            chart_series.update(timestamps, values)
+
+    if accumulator.rows < 2:
+        raise ValueError("Not enough data to generate report")
+    accumulator.write_report(report_path, json_path)
+    return accumulator, chart_series.series() if chart_series is not None else None
@@ -0,0 +1,146 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Request priorities, lower runs first
+ORDER_PRIORITY = 0  # Order submits and cancels
+READ_PRIORITY = 1   # Account, positions, bars and other informational reads
+
+# Broker methods that change state, everything else is treated as a read
+ORDER_METHODS = {'submit_order', 'cancel_order', 'cancel_all_orders', 'replace_order', 'close_position', 'close_all_positions'}
+
+class RequestDropped(Exception):
+    """Raised when a read is rejected because too many requests are already waiting."""
+
+class _SharedRead:
+    # One in-flight or recently finished read that identical reads can reuse
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.finished_at = None
+
+class RequestScheduler:
+    """Token bucket shared by every REST call the bot makes, so bursts at the top of the minute stay under the broker's limit.
+    Order submits and cancels jump ahead of waiting reads, identical reads made within `coalesce_seconds`
+    share one HTTP call, and reads are dropped (RequestDropped) rather than queued without limit."""
+
+    def __init__(self, rate_per_minute=190, burst=10, coalesce_seconds=1.0, max_queued_reads=200):
+        self.rate = rate_per_minute / 60.0  # Tokens added per second
+        self.burst = burst
+        self.coalesce_seconds = coalesce_seconds
+        self.max_queued_reads = max_queued_reads
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._waiting = []  # Heap of (priority, sequence) tickets
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._reads = {}  # key -> _SharedRead
+        self._reads_lock = threading.Lock()
+        self.counters = {'executed': 0, 'queued': 0, 'throttled': 0, 'dropped': 0, 'coalesced': 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def _acquire(self, priority):
+        # Blocks until this request holds a token; higher priority tickets are served first
+        with self._cond:
+            if priority == READ_PRIORITY and sum(1 for ticket in self._waiting if ticket[0] == READ_PRIORITY) >= self.max_queued_reads:
+                self.counters['dropped'] += 1
+                raise RequestDropped(f"{self.max_queued_reads} reads already waiting for the rate limit")
+
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiting, ticket)
+            self.counters['queued'] += 1
+            throttled = False
+            try:
+                while True:
+                    self._refill()
+                    if self._waiting[0] == ticket and self._tokens >= 1:
+                        self._tokens -= 1
+                        heapq.heappop(self._waiting)
+                        break
+                    throttled = True
+                    wait = (1 - self._tokens) / self.rate if self._tokens < 1 else None
+                    self._cond.wait(wait)
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                self.counters['queued'] -= 1
+                if throttled:
+                    self.counters['throttled'] += 1
+                self._cond.notify_all()  # Let the next ticket re-check
+
+    def call(self, priority, func, *args, **kwargs):
+        # Runs func(*args, **kwargs) once a token is available
+        self._acquire(priority)
+        self.counters['executed'] += 1
+        return func(*args, **kwargs)
+
+    def read(self, key, func, *args, **kwargs):
+        """ Rate-limited read. Callers asking for the same key while it is in flight,
+        or within coalesce_seconds after it finished, get the same result without another request."""
+        with self._reads_lock:
+            shared = self._reads.get(key)
+            fresh = shared is not None and (shared.finished_at is None or time.monotonic() - shared.finished_at <= self.coalesce_seconds)
+            if fresh:
+                self.counters['coalesced'] += 1
+            else:
+                shared = self._reads[key] = _SharedRead()
+
+        if not fresh:
+            try:
+                shared.result = self.call(READ_PRIORITY, func, *args, **kwargs)
+            except Exception as e:
+                shared.error = e
+            shared.finished_at = time.monotonic()
+            if shared.error is not None:
+                with self._reads_lock:
+                    if self._reads.get(key) is shared:
+                        del self._reads[key]  # Don't hand out a cached failure
+            shared.done.set()
+
+        shared.done.wait()
+        if shared.error is not None:
+            raise shared.error
+        return shared.result
+
+    def invalidate_reads(self):
+        # Forget finished reads, e.g. after an order changes account state
+        with self._reads_lock:
+            self._reads = {key: shared for key, shared in self._reads.items() if shared.finished_at is None}
+
+    def stats(self):
+        with self._cond:
+            return dict(self.counters, tokens=round(self._tokens, 2))
+
+class ScheduledAPI:
+    """Wraps an alpaca_trade_api REST client so every method call goes through a RequestScheduler.
+    Order methods get priority, the rest are coalesced reads. Works with any REST object, including one pointed at a local test server."""
+
+    def __init__(self, api, scheduler):
+        self._api = api
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attribute = getattr(self._api, name)
+        if not callable(attribute):
+            return attribute
+
+        def scheduled(*args, **kwargs):
+            if name in ORDER_METHODS:
+                try:
+                    return self.scheduler.call(ORDER_PRIORITY, attribute, *args, **kwargs)
+                finally:
+                    self.scheduler.invalidate_reads()
+            key = (name, repr(args), repr(sorted(kwargs.items())))
+            return self.scheduler.read(key, attribute, *args, **kwargs)
+        return scheduled
+
+# One scheduler for the whole process, the broker's limit is per account
+broker_scheduler = RequestScheduler()
@@ -0,0 +1,55 @@
+#sma
+# Times the vectorized backtest_strategy against the original row-by-row loop and checks the equity curves are identical.
+# Uses synthetic random-walk prices: 12 years of daily bars and 12 years of regular-hours minute bars.
+import sys
+import time
+import numpy as np
+import pandas as pd
+from sma_strategy import generate_signals, backtest_strategy, backtest_strategy_loop
+
+def synthetic_prices(index, seed=0, start_price=100.0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0002, 0.01, len(index))
+    return pd.DataFrame({'Close': start_price * np.exp(np.cumsum(returns))}, index=index)
+
+def daily_index(years=12):
+    return pd.bdate_range('2012-01-02', periods=252 * years)
+
+def minute_index(years=12):
+    days = pd.bdate_range('2012-01-02', periods=252 * years)
+    minutes = pd.timedelta_range('09:30:00', periods=390, freq='min')
+    return pd.DatetimeIndex((days.values[:, None] + minutes.values[None, :]).ravel())
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def compare(name, data, short_window, long_window, initial_capital=100000.0, loop_rows=None):
+    """ Runs both backtests and prints their timings. The loop is slow enough that on minute data it is only run on
+    the first loop_rows rows; its time is scaled up to the full length and the results are compared on those rows."""
+    signals = generate_signals(data.copy(), short_window, long_window)
+    # The equity rule adds the held position's value on every bar, so over a million minute bars equity overflows to inf
+    with np.errstate(over='ignore', invalid='ignore'):
+        vectorized, vectorized_time = timed(backtest_strategy, signals.copy(), initial_capital)
+
+    subset = signals if loop_rows is None else signals.iloc[:loop_rows].copy()
+    loop, loop_time = timed(backtest_strategy_loop, subset.copy(), initial_capital)
+    loop_estimate = loop_time * len(signals) / len(subset)
+
+    expected = loop['equity'].to_numpy(dtype=np.float64)
+    actual = backtest_strategy(subset.copy(), initial_capital)['equity'].to_numpy()
+    identical = np.array_equal(expected, actual)
+    trades = int((signals['positions'].abs() == 1).sum())
+
+    scaled = '' if loop_rows is None else f" (measured on {len(subset):,} rows)"
+    print(f"{name}: {len(signals):,} rows, {trades} trades")
+    print(f"  loop:       {loop_estimate:10.3f}s{scaled}")
+    print(f"  vectorized: {vectorized_time:10.3f}s")
+    print(f"  speedup:    {loop_estimate / vectorized_time:10.0f}x, identical: {identical}")
+    return identical
+
+if __name__ == "__main__":
+    ok = compare('Daily, 12 years', synthetic_prices(daily_index()), 50, 200)
+    ok &= compare('Minute, 12 years', synthetic_prices(minute_index(), seed=1), 390, 1950, loop_rows=50000)
+    sys.exit(0 if ok else 1)
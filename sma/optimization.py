@@ -1,11 +1,118 @@
 #sma
+import os
+import sys
 import numpy as np
 import pandas as pd
 from itertools import product
-from sma_strategy import generate_signals, backtest_strategy
+from sma_strategy import generate_signals, backtest_strategy, equity_curve, load_prices
 from performance_visualization import calculate_sharpe_ratio, calculate_max_drawdown, calculate_cagr, calculate_win_loss_ratio
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # sweep_runner lives in the project root
+from sweep_runner import run_sweep, code_version
+
+RESULT_COLUMNS = ['Short Window', 'Long Window', 'Sharpe Ratio', 'Max Drawdown', 'CAGR', 'Win/Loss Ratio']
+MAX_GRID_CELLS = 20_000_000  # Bars x window pairs evaluated per block, bounds memory on long minute series
+
+def sma_matrix(close, windows):
+    """ Rolling means (min_periods=1, like generate_signals) of close for every window, from one cumulative sum.
+    Prices are taken relative to the first close to keep the cumulative sum small; crossovers only compare means, so the offset doesn't matter."""
+    relative = close - close[0]
+    cumulative = np.concatenate(([0.0], np.cumsum(relative)))
+    bars = np.arange(1, len(close) + 1)
+    smas = np.empty((len(close), len(windows)))
+    for column, window in enumerate(windows):
+        start = np.maximum(bars - window, 0)
+        smas[:, column] = (cumulative[bars] - cumulative[start]) / (bars - start)
+    return smas
+
+def grid_metrics(equity, positions, index, risk_free_rate=0.01):
+    """ performance_visualization's Sharpe, max drawdown, CAGR and win/loss for each column of an equity matrix
+    (bars x pairs) at once. positions holds the matching signal diffs."""
+    returns = equity[1:] / equity[:-1] - 1
+    excess_returns = returns - risk_free_rate / 252
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe_ratio = excess_returns.mean(axis=0) / excess_returns.std(axis=0) * np.sqrt(252)
+
+        cumulative_returns = equity / equity[0]
+        max_drawdown = (cumulative_returns - np.maximum.accumulate(cumulative_returns, axis=0)).min(axis=0)
+
+        num_years = (index[-1] - index[0]).days / 365.25
+        cagr = (equity[-1] / equity[0]) ** (1 / num_years) - 1
+
+        # Equity change between consecutive trade rows (the first row counts as a trade, like positions != 0 with NaN)
+        win_loss_ratio = np.empty(equity.shape[1])
+        for column in range(equity.shape[1]):
+            trades = equity[(positions[:, column] != 0), column]
+            changes = np.diff(trades)
+            win_loss_ratio[column] = np.sum(changes > 0) / np.sum(changes <= 0)
+    return sharpe_ratio, max_drawdown, cagr, win_loss_ratio
+
+def evaluate_grid(data, short_window_range, long_window_range, initial_capital, max_cells=MAX_GRID_CELLS):
+    """ Evaluates every (short, long) pair with short < long, in the order optimize_parameters_loop would.
+    Each distinct window's SMA is computed once, and signals and positions for a block of pairs come from one
+    2-D comparison; only the per-pair equity (which depends on the equity at each entry) is walked trade by trade.
+    Returns a results DataFrame with RESULT_COLUMNS."""
+    pairs = [(short_window, long_window) for short_window, long_window in product(short_window_range, long_window_range) if short_window < long_window]
+    if not pairs:
+        return pd.DataFrame(columns=RESULT_COLUMNS)
+
+    close = data['Close'].to_numpy(dtype=np.float64)
+    windows = sorted(set(window for pair in pairs for window in pair))
+    column_of = {window: column for column, window in enumerate(windows)}
+    smas = sma_matrix(close, windows)
+    bars = np.arange(len(close))[:, None]
+
+    results = []
+    block = max(1, max_cells // max(len(close), 1))
+    for first in range(0, len(pairs), block):
+        short_windows, long_windows = np.array(pairs[first:first + block]).T
+        short_columns = [column_of[window] for window in short_windows]
+        long_columns = [column_of[window] for window in long_windows]
+
+        # signal is 1 where the short SMA is above the long one, from bar short_window on
+        signals = ((smas[:, short_columns] > smas[:, long_columns]) & (bars >= short_windows)).astype(np.float64)
+        positions = np.empty_like(signals)
+        positions[0] = np.nan
+        positions[1:] = np.diff(signals, axis=0)
+
+        equity = np.column_stack([equity_curve(close, positions[:, column], initial_capital) for column in range(len(short_windows))])
+        metrics = grid_metrics(equity, positions, data.index)
+        results.extend(zip(short_windows.tolist(), long_windows.tolist(), *(values.tolist() for values in metrics)))
+
+    return pd.DataFrame(results, columns=RESULT_COLUMNS)
+
+def best_pair(results_df):
+    # (short, long) with the highest Sharpe ratio, first one on ties, None if no pair has a Sharpe ratio
+    sharpe = results_df['Sharpe Ratio'].to_numpy(dtype=np.float64)
+    if not len(sharpe) or np.isnan(sharpe).all():
+        return None
+    best = int(np.nanargmax(sharpe))
+    return int(results_df['Short Window'].iloc[best]), int(results_df['Long Window'].iloc[best])
+
 def optimize_parameters(data, short_window_range, long_window_range, initial_capital):
+    # Best (short, long) by Sharpe ratio and the results for every pair, see evaluate_grid
+    results_df = evaluate_grid(data, short_window_range, long_window_range, initial_capital)
+    return best_pair(results_df), results_df
+
+def _short_window_task(params, frames):
+    # All pairs for one short window, run in a sweep worker
+    results_df = evaluate_grid(frames['prices'], [params['short_window']], params['long_windows'], params['initial_capital'])
+    return results_df.values.tolist()
+
+def optimize_parameters_parallel(data, short_window_range, long_window_range, initial_capital, workers=None, results_path=None):
+    """ optimize_parameters spread over a process pool, one task per short window. The prices go to the workers
+    through shared memory once; with results_path an interrupted search resumes where it stopped."""
+    tasks = [{'short_window': short_window, 'long_windows': list(long_window_range), 'initial_capital': initial_capital}
+             for short_window in short_window_range]
+    code = code_version(sys.modules[__name__], sys.modules[equity_curve.__module__], sys.modules[calculate_sharpe_ratio.__module__])
+    outcomes = run_sweep(_short_window_task, tasks, {'prices': data[['Close']]}, workers, results_path, run_key={'code': code})
+    results_df = pd.DataFrame([row for rows in outcomes for row in rows], columns=RESULT_COLUMNS)
+    results_df[['Short Window', 'Long Window']] = results_df[['Short Window', 'Long Window']].astype(int)
+
+    return best_pair(results_df), results_df
+
+def optimize_parameters_loop(data, short_window_range, long_window_range, initial_capital):
+    # Original one-backtest-per-pair search, kept as the reference for optimize_parameters
     best_sharpe = -np.inf
     best_params = None
     results = []
@@ -32,10 +139,9 @@ def optimize_parameters(data, short_window_range, long_window_range, initial_cap
     return best_params, results_df
 
 if __name__ == "__main__":
-    import yfinance as yf
     import matplotlib.pyplot as plt
 
-    data = yf.download('SPY', start='2022-01-01', end='2024-05-30')
+    data = load_prices('SPY', '2022-01-01', '2024-05-30')
     short_window_range = range(10, 60, 10)
     long_window_range = range(100, 300, 50)
     initial_capital = 100000.0
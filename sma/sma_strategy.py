@@ -1,9 +1,13 @@
 # sma_strategy.py
 import pandas as pd
+import os
+import sys
 import numpy as np
-import yfinance as yf
 from performance_visualization import performance_metrics, plot_performance
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # bar_store lives in the project root
+from bar_store import get_bar_store, yfinance_fetcher
+
 def generate_signals(data, short_window, long_window):
     data['SMA50'] = data['Close'].rolling(window=short_window, min_periods=1).mean()
     data['SMA200'] = data['Close'].rolling(window=long_window, min_periods=1).mean()
@@ -15,7 +19,47 @@ def generate_signals(data, short_window, long_window):
 
     return data
 
+def equity_curve(close, positions, initial_capital):
+    """ Equity of the SMA crossover for one price array and its positions array (signal diffs, NaN first).
+    Only the entries and exits are visited in Python (share counts depend on the equity at entry);
+    equity in between is filled with cumulative sums, in the same order of additions as backtest_strategy_loop."""
+    equity = np.empty(len(close))
+    equity[0] = initial_capital
+    shares = 0
+
+    def fill(start, stop):
+        # Bars start..stop-1 without a trade: flat equity, or previous equity plus the held position's value each bar
+        if start >= stop:
+            return
+        if shares > 0:
+            equity[start:stop] = np.cumsum(np.concatenate(([equity[start - 1]], shares * close[start:stop])))[1:]
+        else:
+            equity[start:stop] = equity[start - 1]
+
+    last = 0
+    for i in np.flatnonzero((positions == 1) | (positions == -1)):
+        if i == 0 or (positions[i] == -1 and shares == 0):
+            continue
+        fill(last + 1, i)
+        if positions[i] == 1:
+            shares = equity[i - 1] // close[i]
+            equity[i] = equity[i - 1] - (shares * close[i])
+            if shares > 0:
+                equity[i] += shares * close[i]
+        else:
+            equity[i] = equity[i - 1] + (shares * close[i])
+            shares = 0
+        last = i
+    fill(last + 1, len(close))
+    return equity
+
 def backtest_strategy(data, initial_capital):
+    # Vectorized version of backtest_strategy_loop with identical results, see equity_curve
+    data['equity'] = equity_curve(data['Close'].to_numpy(dtype=np.float64), data['positions'].to_numpy(dtype=np.float64), initial_capital)
+    return data
+
+def backtest_strategy_loop(data, initial_capital):
+    # Original row-by-row backtest, kept as the reference for backtest_strategy (see benchmark_backtest.py)
     data['equity'] = initial_capital
     position = 0
     shares = 0
@@ -37,9 +81,14 @@ def backtest_strategy(data, initial_capital):
 
     return data
 
+def load_prices(symbol, start_date, end_date):
+    # Daily bars with yfinance-style column names, from the local bar store (downloaded once, then reused)
+    data = get_bar_store().get(symbol, 'day', start_date, end_date, yfinance_fetcher())
+    return data.rename(columns=str.capitalize)
+
 def run_sma_strategy(symbol='SPY', start_date='2022-01-01', end_date='2024-05-30', short_window=50, long_window=200, initial_capital=100000.0):
 
-    data = yf.download(symbol, start=start_date, end=end_date)
+    data = load_prices(symbol, start_date, end_date)
     data_with_signals = generate_signals(data, short_window, long_window)
     backtested_data = backtest_strategy(data_with_signals, initial_capital)
     
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+"""Parallel parameter sweeps. Market data is published once into shared memory and every worker maps it instead of
+receiving a pickled copy per task. Results stream back as they finish, are appended to a results file so an
+interrupted sweep can resume, and come back in parameter order whatever order the workers finished in.
+The results file starts with a fingerprint of the run (task, data, run_key), so a sweep over other data, dates or
+code never picks up its results."""
+
+class SharedFrames:
+    """A dict of DataFrames (numeric columns, any index) copied once into shared memory.
+    descriptor() is small and picklable; attach_frames(descriptor) in another process gives read-only DataFrames
+    backed by the same memory. The owner must close() it when the sweep is done."""
+
+    def __init__(self, frames):
+        self._blocks = []
+        self._descriptor = {}
+        for name, frame in frames.items():
+            values = np.ascontiguousarray(frame.to_numpy(dtype=np.float64))
+            index = frame.index
+            block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+            np.ndarray(values.shape, dtype=np.float64, buffer=block.buf)[...] = values
+            self._blocks.append(block)
+            self._descriptor[name] = {
+                'block': block.name,
+                'shape': values.shape,
+                'columns': list(frame.columns),
+                'index': index.values.astype('datetime64[ns]').astype(np.int64) if isinstance(index, pd.DatetimeIndex) else np.asarray(index),
+                'tz': str(index.tz) if isinstance(index, pd.DatetimeIndex) and index.tz is not None else None,
+                'datetime': isinstance(index, pd.DatetimeIndex),
+                'index_name': index.name
+            }
+
+    def descriptor(self):
+        return self._descriptor
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+_attached_blocks = []  # Keeps worker-side mappings open for the life of the process
+_worker_data = None  # DataFrames attached in this worker
+
+def attach_frames(descriptor):
+    frames = {}
+    for name, spec in descriptor.items():
+        block = shared_memory.SharedMemory(name=spec['block'])
+        _attached_blocks.append(block)
+        values = np.ndarray(spec['shape'], dtype=np.float64, buffer=block.buf)
+        values.flags.writeable = False  # Shared by every worker
+        if spec['datetime']:
+            index = pd.DatetimeIndex(spec['index'].astype('datetime64[ns]'), name=spec['index_name'])
+            if spec['tz'] is not None:
+                index = index.tz_localize('UTC').tz_convert(spec['tz'])
+        else:
+            index = pd.Index(spec['index'], name=spec['index_name'])
+        frames[name] = pd.DataFrame(values, index=index, columns=spec['columns'], copy=False)
+    return frames
+
+def _init_worker(descriptor, initializer, initargs):
+    global _worker_data
+    _worker_data = attach_frames(descriptor) if descriptor is not None else {}
+    if initializer is not None:
+        initializer(*initargs)
+
+def _run_task(task, index, params):
+    start = time.time()
+    return index, task(params, _worker_data), time.time() - start
+
+def _to_json(value):
+    # numpy scalars and arrays in task results
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _params_key(params):
+    return json.dumps(params, sort_keys=True, default=_to_json)
+
+def _ends_mid_line(path):
+    with open(path, 'rb') as file:
+        file.seek(0, os.SEEK_END)
+        if file.tell() == 0:
+            return False
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) != b'\n'
+
+def code_version(*modules):
+    # Hash of the modules' source files, for run_key, so results from older code are not reused
+    digest = hashlib.sha1()
+    for module in modules:
+        with open(module.__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def run_fingerprint(task, frames=None, run_key=None):
+    """ Identifies a sweep: the task function, every frame's contents (index, columns and values) and run_key
+    (anything JSON-serializable the results depend on, e.g. dates, symbols and code_version())."""
+    digest = hashlib.sha1()
+    digest.update(f"{task.__module__}.{task.__qualname__}".encode())
+    digest.update(json.dumps(run_key, sort_keys=True, default=_to_json).encode())
+    for name in sorted(frames or {}):
+        frame = frames[name]
+        digest.update(json.dumps([str(name), [str(column) for column in frame.columns]]).encode())
+        digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+def _read_fingerprint(path):
+    # Fingerprint in the results file's header line, None if it has none
+    with open(path) as file:
+        try:
+            return json.loads(file.readline()).get('fingerprint')
+        except (ValueError, AttributeError):
+            return None
+
+def load_results(path, fingerprint=None):
+    """ {params key: result} from a results file written by run_sweep; a truncated last line (crash mid-write) is ignored.
+    With a fingerprint, a file written for a different run gives no results."""
+    done = {}
+    if path is None or not os.path.exists(path):
+        return done
+    if fingerprint is not None and _read_fingerprint(path) != fingerprint:
+        return done
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if 'params' in record:
+                done[_params_key(record['params'])] = record['result']
+    return done
+
+def run_sweep(task, param_sets, frames=None, workers=None, results_path=None, initializer=None, initargs=(),
+              progress_every=1, max_in_flight=None, run_key=None):
+    """ Runs task(params, frames) for every params in param_sets on a process pool and returns the results in
+    param_sets order.
+    - frames: dict of DataFrames put in shared memory once; task receives read-only views of them.
+    - workers: pool size (default: all cores); 1 runs everything in this process, which is handy for debugging.
+    - results_path: JSON-lines file each result is appended to as it finishes; parameter sets already in it are
+      skipped, so rerunning an interrupted sweep resumes it. Only a file written for the same run (see run_fingerprint)
+      is resumed, any other one is moved aside to <results_path>.stale. The file is deleted once the sweep completes.
+    - run_key: what else the results depend on besides the task and frames (dates, symbols, code_version(...)).
+    - initializer(*initargs) runs once in each worker (e.g. to point logs at per-process files).
+    task must be a module-level function, params and results must be JSON-serializable."""
+    global _worker_data
+    param_sets = list(param_sets)
+    total = len(param_sets)
+    results = [None] * total
+    fingerprint = run_fingerprint(task, frames, run_key)
+    if results_path is not None and os.path.exists(results_path) and _read_fingerprint(results_path) != fingerprint:
+        logging.warning(f"{results_path} is from a different run (data, dates or code changed), moving it to {results_path}.stale")
+        os.replace(results_path, results_path + '.stale')
+    done = load_results(results_path, fingerprint)
+    pending = []
+    for index, params in enumerate(param_sets):
+        key = _params_key(params)
+        if key in done:
+            results[index] = done[key]
+        else:
+            pending.append((index, params))
+    if done:
+        logging.info(f"Resuming sweep: {total - len(pending)}/{total} parameter sets already in {results_path}")
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    results_file = None
+    if results_path is not None:
+        results_file = open(results_path, 'a')
+        if results_file.tell() == 0:
+            results_file.write(json.dumps({'fingerprint': fingerprint}) + '\n')
+            results_file.flush()
+        elif _ends_mid_line(results_path):
+            results_file.write('\n')  # Finish a line cut off by a crash so the next record starts clean
+    shared = SharedFrames(frames) if frames and workers > 1 else None
+    started = time.time()
+    finished = 0
+
+    def record(index, result, elapsed):
+        nonlocal finished
+        results[index] = result
+        finished += 1
+        if results_file is not None:
+            results_file.write(json.dumps({'index': index, 'params': param_sets[index], 'result': result, 'time': elapsed}, default=_to_json) + '\n')
+            results_file.flush()
+        if finished % progress_every == 0 or finished == len(pending):
+            rate = finished / max(time.time() - started, 1e-9)
+            remaining = (len(pending) - finished) / rate
+            logging.info(f"Sweep progress: {total - len(pending) + finished}/{total} done, {rate:.2f} sets/s, ~{remaining:.0f}s left")
+
+    try:
+        if workers == 1:
+            _worker_data = frames or {}
+            if initializer is not None:
+                initializer(*initargs)
+            for index, params in pending:
+                record(*_run_task(task, index, params))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shared.descriptor() if shared else None, initializer, initargs)) as pool:
+                queue = iter(pending)
+                running = set()
+                while True:
+                    # Keep a bounded number of tasks submitted so results stream back without queueing the whole grid
+                    for index, params in queue:
+                        running.add(pool.submit(_run_task, task, index, params))
+                        if len(running) >= max_in_flight:
+                            break
+                    if not running:
+                        break
+                    completed, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        record(*future.result())
+    finally:
+        if results_file is not None:
+            results_file.close()
+        if shared is not None:
+            shared.close()
+    if results_path is not None:
+        os.remove(results_path)  # Complete, nothing left to resume
+    return results
@@ -0,0 +1,114 @@
+#tests
+# Runs tests/historic_data/fetch_data.py against a local fake bars endpoint (APCA_API_DATA_URL) and checks that
+# pages are followed, existing CSVs and stored dates are not fetched again, an interrupted download resumes from
+# its last flush, failed requests are retried and the CSVs are rewritten atomically. Everything runs in a temp dir.
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import pandas as pd
+
+class FakeBars(BaseHTTPRequestHandler):
+    """/v2/stocks/{symbol}/bars with one daily bar per business day, page_size bars per page.
+    fail_token makes the request for that page token fail with a 500 (fail_count times)."""
+    requests = []
+    page_size = 3
+    fail_token = None
+    fail_count = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        symbol = url.path.split('/')[-2]
+        token = query.get('page_token', [None])[0]
+        with self.lock:
+            self.requests.append((symbol, query['start'][0][:10], query['end'][0][:10], token))
+            fail = token is not None and token == self.fail_token and FakeBars.fail_count > 0
+            if fail:
+                FakeBars.fail_count -= 1
+        if fail:
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'{"message": "fake outage"}')
+            return
+
+        days = pd.bdate_range(query['start'][0][:10], query['end'][0][:10])
+        offset = int(token or 0)
+        page = days[offset:offset + self.page_size]
+        bars = [{'t': day.strftime('%Y-%m-%dT05:00:00Z'), 'o': 1.0, 'h': 2.0, 'l': 0.5, 'c': float(day.day), 'v': 100} for day in page]
+        next_token = str(offset + self.page_size) if offset + self.page_size < len(days) else None
+        body = json.dumps({'bars': bars, 'symbol': symbol, 'next_page_token': next_token}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(body)
+
+def requested(symbol):
+    return [request for request in FakeBars.requests if request[0] == symbol]
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBars)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['APCA_API_DATA_URL'] = f"http://127.0.0.1:{server.server_port}"  # Read when each thread's client is created
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'historic_data'))
+    import fetch_data
+    from bar_store import BarStore
+
+    fetch_data.flush_bars = 4
+    fetch_data.retry_backoff = 0.01
+    work_dir = tempfile.mkdtemp()
+    store = BarStore(os.path.join(work_dir, 'bars'))
+    csv_dir = os.path.join(work_dir, 'csv')
+    os.makedirs(csv_dir)
+
+    # Paging, then a wider range only fetches the new dates
+    data = fetch_data.fetch_historical_data(['AAPL', 'MSFT'], '2024-01-01', '2024-02-01', store, csv_dir=csv_dir)
+    assert len(data['AAPL']) == len(pd.bdate_range('2024-01-01', '2024-01-31')) == 23, len(data['AAPL'])
+    assert len(requested('AAPL')) == 8, requested('AAPL')  # 23 bars, 3 per page
+    FakeBars.requests.clear()
+    data = fetch_data.fetch_historical_data(['AAPL', 'MSFT'], '2024-01-01', '2024-02-15', store, csv_dir=csv_dir)
+    assert {request[1] for request in FakeBars.requests} == {'2024-02-01'}, FakeBars.requests
+    assert len(data['MSFT']) == 33
+    print("paging and top-up: only 2024-02-01 onwards requested on the second run")
+
+    # Dates in an existing CSV are imported, not downloaded
+    fetch_data.export_csv(store, 'AAPL', '2024-01-01', '2024-02-15', csv_dir)
+    os.rename(os.path.join(csv_dir, 'AAPL_historical_data.csv'), os.path.join(csv_dir, 'GOOG_historical_data.csv'))
+    FakeBars.requests.clear()
+    data = fetch_data.fetch_historical_data(['GOOG'], '2024-01-01', '2024-03-01', store, csv_dir=csv_dir)
+    assert [request[1] for request in requested('GOOG') if request[3] is None] == ['2024-02-15'], requested('GOOG')
+    assert len(data['GOOG']) == len(pd.bdate_range('2024-01-01', '2024-02-29'))
+    print("existing CSV: imported, only dates after it requested")
+
+    # Interrupted after the first flush: the next run starts from the last flushed day
+    fetch_data.max_retries = 0
+    FakeBars.fail_token, FakeBars.fail_count = '6', 1
+    FakeBars.requests.clear()
+    fetch_data.fetch_historical_data(['NFLX'], '2024-01-01', '2024-02-01', store, csv_dir=csv_dir)
+    assert len(store.frame('NFLX', 'day')) == 4, "first flush was not kept"
+    FakeBars.requests.clear()
+    data = fetch_data.fetch_historical_data(['NFLX'], '2024-01-01', '2024-02-01', store, csv_dir=csv_dir)
+    assert requested('NFLX')[0][1] == '2024-01-04', requested('NFLX')
+    assert len(data['NFLX']) == 23
+    print("interrupted download: resumed from 2024-01-04")
+
+    # Failed requests are retried
+    fetch_data.max_retries = 3
+    FakeBars.fail_token, FakeBars.fail_count = '3', 2
+    data = fetch_data.fetch_historical_data(['V'], '2024-01-01', '2024-02-01', store, csv_dir=csv_dir)
+    assert len(data['V']) == 23 and FakeBars.fail_count == 0
+    print("retries: two failed pages retried, all bars stored")
+
+    # CSVs are replaced atomically, no temp file left behind
+    path = fetch_data.export_csv(store, 'V', '2024-01-01', '2024-02-01', csv_dir)
+    assert sorted(os.listdir(csv_dir)) == ['GOOG_historical_data.csv', 'V_historical_data.csv'], os.listdir(csv_dir)
+    assert list(pd.read_csv(path).columns) == ['time', 'open', 'high', 'low', 'close', 'volume']
+    print("export: CSV written in the original layout")
+    server.shutdown()
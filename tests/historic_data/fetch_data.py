@@ -1,45 +1,148 @@
 import pandas as pd
 import alpaca_trade_api as tradeapi
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
 import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))  # bar_store lives in the project root
+from bar_store import BarStore, BAR_STORE_DIR, BAR_COLUMNS
 
 # Alpaca API credentials (replace with your own if necessary)
 ALPACA_API_KEY = 'PKMVI5CXPN6CGPSUTMO2'
 ALPACA_SECRET_KEY = 'yoB2K6D3gCvRepN3SkGFjSdzmeEXjxv6gZ0GNacw'
 BASE_URL = 'https://paper-api.alpaca.markets'
-
-# Initialize Alpaca API
-api = tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2')
+# Market data comes from APCA_API_DATA_URL when it is set, e.g. a local fake bars server for testing
 
 # Define the symbols and date range for historical data
 symbols = ['AAPL', 'GOOG', 'AMZN', 'MSFT', 'META', 'TSLA', 'NFLX', 'NVDA', 'V', 'PYPL']
 start_date = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
 end_date = datetime.now().strftime('%Y-%m-%d')
 
-# Function to fetch historical data
-def fetch_historical_data(symbols, start, end):
-    historical_data = {}
-    for symbol in symbols:
+OUTPUT_DIR = 'tests/historic_data'
+max_concurrency = 8  # Symbols downloaded at the same time
+max_retries = 3  # Attempts per symbol after a failed request, with exponential backoff
+retry_backoff = 1.0  # Seconds before the first retry
+flush_bars = 5000  # Bars buffered before they are written to the store, so an interrupted download resumes from there
+
+_clients = threading.local()
+
+def get_api():
+    # One REST client per worker thread, requests sessions aren't meant to be shared between threads
+    if not hasattr(_clients, 'api'):
+        _clients.api = tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2')
+    return _clients.api
+
+def _to_frame(items):
+    # Raw v2 bar dicts (t, o, h, l, c, v) to a DataFrame indexed by UTC time
+    frame = pd.DataFrame(items)
+    index = pd.DatetimeIndex(pd.to_datetime(frame['t'], utc=True), name='timestamp')
+    return pd.DataFrame({'open': frame['o'].values, 'high': frame['h'].values, 'low': frame['l'].values,
+                         'close': frame['c'].values, 'volume': frame['v'].values}, index=index)
+
+def download_gap(store, symbol, timeframe, gap_start, gap_end):
+    """ Streams one missing [gap_start, gap_end) range page by page and writes it to the store every flush_bars bars.
+    Each flush marks the dates before the last bar's date as fetched, so a crash only loses the unflushed tail."""
+    timeframes = {'minute': tradeapi.rest.TimeFrame.Minute, 'day': tradeapi.rest.TimeFrame.Day}
+    items = get_api().get_bars_iter(symbol, timeframes[timeframe], start=gap_start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                    end=(gap_end - pd.Timedelta(seconds=1)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                                    adjustment='raw', feed='iex', raw=True)
+    buffer = []
+    fetched = 0
+    for item in items:
+        buffer.append(item)
+        if len(buffer) >= flush_bars:
+            bars = _to_frame(buffer)
+            last_day = bars.index[-1].tz_convert('UTC').normalize().tz_localize(None)
+            store.add(symbol, timeframe, bars, gap_start, max(gap_start, last_day))  # The last day may still be incomplete
+            fetched += len(buffer)
+            buffer = []
+    bars = _to_frame(buffer) if buffer else pd.DataFrame(columns=list(BAR_COLUMNS), index=pd.DatetimeIndex([], tz='UTC'))
+    store.add(symbol, timeframe, bars, gap_start, gap_end)
+    return fetched + len(buffer)
+
+def import_csv(store, symbol, output_dir=OUTPUT_DIR):
+    """ Adds the dates of an existing {symbol}_historical_data.csv that the store doesn't cover yet, so data
+    downloaded by earlier runs of this script isn't fetched again. The CSV only has dates, bars are stored at midnight UTC.
+    Returns the number of bars imported."""
+    file_path = os.path.join(output_dir, f"{symbol}_historical_data.csv")
+    if not os.path.exists(file_path):
+        return 0
+    bars = pd.read_csv(file_path)
+    if bars.empty:
+        return 0
+    bars.index = pd.DatetimeIndex(pd.to_datetime(bars.pop('time')), name='timestamp').tz_localize('UTC')
+    first, last = bars.index[0].tz_localize(None), bars.index[-1].tz_localize(None) + pd.Timedelta(days=1)
+    imported = 0
+    for gap_start, gap_end in store.missing('day', symbol, first, last):
+        gap = bars[(bars.index >= gap_start.tz_localize('UTC')) & (bars.index < gap_end.tz_localize('UTC'))]
+        store.add(symbol, 'day', gap, gap_start, gap_end)
+        imported += len(gap)
+    return imported
+
+def top_up_symbol(store, symbol, timeframe, start, end):
+    # Downloads every range of [start, end) the store doesn't have yet, retrying failed requests
+    fetched = 0
+    for attempt in range(max_retries + 1):
         try:
-            bars = api.get_bars(symbol, tradeapi.TimeFrame.Day, start=start, end=end, adjustment='raw', feed='iex').df
-            bars = bars.reset_index()
-            bars['time'] = bars['timestamp'].dt.strftime('%Y-%m-%d')
-            data = bars[['time', 'open', 'high', 'low', 'close', 'volume']]
-            historical_data[symbol] = data
+            for gap_start, gap_end in store.missing(timeframe, symbol, start, end):
+                fetched += download_gap(store, symbol, timeframe, gap_start, gap_end)
+            return fetched
         except Exception as e:
-            print(f"Error fetching data for {symbol}: {e}")
+            if attempt == max_retries:
+                raise
+            delay = retry_backoff * 2 ** attempt
+            logging.warning(f"Fetching {symbol} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def export_csv(store, symbol, start, end, output_dir=OUTPUT_DIR):
+    # Writes the daily bars in the original CSV layout, through a temp file so readers never see a half-written file
+    bars = store.frame(symbol, 'day', start, end).reset_index()
+    bars['time'] = bars['timestamp'].dt.strftime('%Y-%m-%d')
+    file_path = os.path.join(output_dir, f"{symbol}_historical_data.csv")
+    bars[['time', 'open', 'high', 'low', 'close', 'volume']].to_csv(file_path + '.tmp', index=False)
+    os.replace(file_path + '.tmp', file_path)
+    return file_path
+
+# Function to fetch historical data
+def fetch_historical_data(symbols, start, end, store=None, timeframe='day', csv_dir=OUTPUT_DIR):
+    """ Tops up the local bar store for every symbol, max_concurrency symbols at a time, and returns
+    {symbol: bars DataFrame}. Daily bars in the existing CSVs are imported first, then only date ranges still
+    missing from the store are downloaded."""
+    store = store or BarStore(BAR_STORE_DIR)
+    if timeframe == 'day':
+        for symbol in symbols:
+            imported = import_csv(store, symbol, csv_dir)
+            if imported:
+                print(f"{symbol}: imported {imported} bars from existing CSV")
+    historical_data = {}
+    with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='fetch') as pool:
+        futures = {pool.submit(top_up_symbol, store, symbol, timeframe, start, end): symbol for symbol in symbols}
+        for future in as_completed(futures):
+            symbol = futures[future]
+            try:
+                fetched = future.result()
+                historical_data[symbol] = store.frame(symbol, timeframe, start, end)
+                print(f"{symbol}: {fetched} new bars, {len(historical_data[symbol])} total")
+            except Exception as e:
+                print(f"Error fetching data for {symbol}: {e}")
     return historical_data
 
-# Fetch historical data
-historical_data = fetch_historical_data(symbols, start_date, end_date)
+if __name__ == "__main__":
+    store = BarStore(BAR_STORE_DIR)
+
+    # Fetch historical data
+    historical_data = fetch_historical_data(symbols, start_date, end_date, store)
 
-# Create directory for historical data if it doesn't exist
-os.makedirs('historic_data', exist_ok=True)
+    # Create directory for historical data if it doesn't exist
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Save the data to CSV files in the historic_data directory
-for symbol, data in historical_data.items():
-    file_path = os.path.join('tests/historic_data', f"{symbol}_historical_data.csv")
-    data.to_csv(file_path, index=False)
-    print(f"Saved data for {symbol} to {file_path}")
+    # Save the data to CSV files in the historic_data directory
+    for symbol in historical_data:
+        file_path = export_csv(store, symbol, start_date, end_date)
+        print(f"Saved data for {symbol} to {file_path}")
 
-print("Historical data fetching complete.")
+    print("Historical data fetching complete.")
@@ -0,0 +1,65 @@
+#tests
+# Checks the vectorized indicators (calculate_rsi_batch, calculate_volume_rsi_batch, calculate_atr_batch and
+# calculate_indicators_multi_window) against the pandas calculate_rsi, calculate_volume_rsi and calculate_atr they replace.
+# The prefix sums round differently from pandas' rolling sums, so values must agree within TOLERANCE and NaNs must be
+# in the same places. Uses synthetic minute bars for several symbols, with flat stretches and missing values, so it runs offline.
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Shared modules live in the project root
+from indicators import (calculate_rsi, calculate_volume_rsi, calculate_atr, calculate_rsi_batch, calculate_volume_rsi_batch,
+                        calculate_atr_batch, calculate_indicators_multi_window)
+
+TOLERANCE = 1e-8  # Absolute, RSI is on a 0-100 scale and ATR on the price scale
+
+def synthetic_bars(rows=20000, symbols=('AAPL', 'MSFT', 'GOOG', 'NVDA', 'JPM'), seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (rows, len(symbols))
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.001, shape), axis=0)), 2)
+    close[1000:1100, 0] = close[999, 0]  # Flat prices: zero gains and losses
+    spread = np.round(rng.uniform(0, 0.1, shape), 2)
+    volume = rng.integers(100, 5000, shape).astype(np.float64)
+    volume[2000:2050, 1] = volume[1999, 1]  # Flat volume
+    close[3000, 2] = np.nan  # A missing bar
+    volume[4000, 3] = np.nan
+    frame = lambda values: pd.DataFrame(values, columns=list(symbols))
+    return frame(close), frame(volume), frame(close + spread), frame(close - spread)
+
+def compare(name, expected, actual):
+    expected, actual = np.asarray(expected, dtype=np.float64), np.asarray(actual, dtype=np.float64)
+    same_nans = bool((np.isnan(expected) == np.isnan(actual)).all())
+    valid = ~np.isnan(expected) & ~np.isnan(actual)
+    worst = float(np.abs(expected[valid] - actual[valid]).max()) if valid.any() else 0.0
+    ok = same_nans and worst <= TOLERANCE
+    print(f"  {name:26}: max difference {worst:.1e}, NaNs {'match' if same_nans else 'differ'}{'' if ok else '  FAILED'}")
+    return ok
+
+def check(windows=(2, 14, 29, 30)):
+    close, volume, high, low = synthetic_bars()
+    multi = calculate_indicators_multi_window(close, volume, high, low, windows)
+    ok = True
+    for window in windows:
+        print(f"window {window}:")
+        rsi = close.apply(lambda column: calculate_rsi(column, window))
+        volume_rsi = volume.apply(lambda column: calculate_volume_rsi(column, window))
+        atr = pd.DataFrame({symbol: calculate_atr(high[symbol], low[symbol], close[symbol], window) for symbol in close})
+        batch = {'rsi': calculate_rsi_batch(close, window), 'volume_rsi': calculate_volume_rsi_batch(volume, window),
+                 'atr': calculate_atr_batch(high, low, close, window)}
+        ok &= compare('calculate_rsi_batch', rsi, batch['rsi'])
+        ok &= compare('calculate_volume_rsi_batch', volume_rsi, batch['volume_rsi'])
+        ok &= compare('calculate_atr_batch', atr, batch['atr'])
+        # multi_window shares the batch functions' prefix sums, so it must equal them exactly
+        for name, values in batch.items():
+            exact = np.array_equal(values.to_numpy(), multi[window][name].to_numpy(), equal_nan=True)
+            print(f"  {'multi_window ' + name:26}: {'identical to the batch function' if exact else 'differs from the batch function  FAILED'}")
+            ok &= exact
+
+    # 1-D input gives 1-D output with the same values
+    series = calculate_rsi_batch(close['AAPL'].to_numpy(), 14)
+    ok &= series.ndim == 1 and compare('1-D calculate_rsi_batch', calculate_rsi(close['AAPL'], 14), series)
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
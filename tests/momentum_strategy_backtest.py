@@ -3,11 +3,18 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-from test_trade_log import initialize_trade_log, log_trade, wait_for_fill
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Shared modules live in the project root
+from test_trade_log import initialize_trade_log, log_trade
 from test_performance_metrics import initialize_performance_log, log_portfolio_value, generate_report
 from test_indicators import calculate_volume_rsi, calculate_atr, calculate_rsi
+from indicators import calculate_indicators_multi_window
+from bar_buffer import BarRingBuffer, BAR_FIELDS
+from bar_store import get_bar_store, alpaca_fetcher
+from replay_engine import replay
 from dotenv import load_dotenv
-import os
 
 load_dotenv()
 
@@ -23,166 +30,245 @@ api = tradeapi.REST(ALPACA_API_KEY, ALPACA_SECRET_KEY, BASE_URL, api_version='v2
 
 symbols = ['AAPL', 'MSFT', 'GOOG', 'NVDA', 'JPM', 'BAC', 'V', 'JNJ', 'PFE', 'PG', 'KO', 'SPY', 'QQQ', 'DIA', 'IWM', 'GLD', 'SLV', 'XOM', 'CVX']
 window = 30
-price_histories = {symbol: [] for symbol in symbols}
-volume_histories = {symbol: [] for symbol in symbols}
-high_histories = {symbol: [] for symbol in symbols}
-low_histories = {symbol: [] for symbol in symbols}
-stop_loss_levels = {}
-take_profit_levels = {}
-active_trades = []
-portfolio_values = []  # List to track portfolio value over time
-
-# Risk management parameters
+
+# Risk management parameters (defaults for BacktestEngine)
 max_daily_loss = 0.05  # 5% of portfolio
 max_drawdown = 0.15    # 15% of portfolio
 allocation_per_trade = 75  # $75 allocation per trade
 stop_loss_pct = 0.015   # 1.5% stop loss
 take_profit_pct = 0.06 # 6% take profit
-initial_portfolio_value = None
-current_daily_loss = 0
-cash, portfolio, portfolio_value = None, None, None  # Initialize portfolio variables
-trade_count = 0  # Initialize trade count
-
-def get_portfolio():
-    # Simulated portfolio for backtesting
-    global cash, portfolio, portfolio_value, initial_portfolio_value
-    if initial_portfolio_value is None:
-        initial_portfolio_value = 10000  # Starting with $10,000
-    portfolio_value = initial_portfolio_value
-    cash = portfolio_value if cash is None else cash
-    portfolio = {} if portfolio is None else portfolio
-    return cash, portfolio, portfolio_value
-
-def generate_signals(price_history, volume_history, high_history, low_history):
-    if len(price_history) < window or len(volume_history) < window:
-        return 0  # Neutral signal if not enough data
-
-    data = pd.DataFrame({
-        'price': price_history,
-        'volume': volume_history,
-        'high': high_history,
-        'low': low_history
-    })
-    data['returns'] = data['price'].pct_change()
-    data['volume_rsi'] = calculate_volume_rsi(data['volume'], window)
-    data['atr'] = calculate_atr(data['high'], data['low'], data['price'], window)
-    data['rsi'] = calculate_rsi(data['price'], window)
-
-    # Example signal generation with RSI
-    if data['returns'].iloc[-1] > 0 and data['volume_rsi'].iloc[-1] > 50 and data['rsi'].iloc[-1] < 70:
-        signal = 1
-    elif data['returns'].iloc[-1] < 0 and data['volume_rsi'].iloc[-1] < 50 and data['rsi'].iloc[-1] > 30:
-        signal = -1
-    else:
-        signal = 0  # Neutral signal
-
-    logging.info(f"Generated signal: {signal} for {price_history[-1]}, returns: {data['returns'].iloc[-1]}, volume_rsi: {data['volume_rsi'].iloc[-1]}, atr: {data['atr'].iloc[-1]}, rsi: {data['rsi'].iloc[-1]}")
-    return signal
-
-def set_stop_loss_take_profit(symbol, buy_price):
-    stop_loss_price = round(buy_price * (1 - stop_loss_pct), 2)
-    take_profit_price = round(buy_price * (1 + take_profit_pct), 2)
-    stop_loss_levels[symbol] = stop_loss_price
-    take_profit_levels[symbol] = take_profit_price
-    logging.info(f"Set stop loss for {symbol} at {stop_loss_price}, take profit at {take_profit_price}")
-
-def execute_trade(symbol, signal, portfolio, cash, portfolio_value):
-    global current_daily_loss, initial_portfolio_value, trade_count
-    try:
-        if initial_portfolio_value is None:
-            initial_portfolio_value = portfolio_value
-
-        # Calculate current drawdown
-        drawdown = (initial_portfolio_value - portfolio_value) / initial_portfolio_value
-
-        # Check daily loss limit and maximum drawdown
-        if current_daily_loss >= max_daily_loss * initial_portfolio_value or drawdown >= max_drawdown:
-            logging.info(f"Risk limits reached. Daily Loss: {current_daily_loss}, Drawdown: {drawdown}. No trades executed.")
-            return
-
-        if signal == 0:
-            logging.info(f"Neutral signal for {symbol}, no trade executed.")
-            return
-
-        latest_price = price_histories[symbol][-1]  # last price from price history
-        if (latest_price is None) or (latest_price <= 0):
-            logging.error(f"Could not fetch latest price for {symbol}, trade not executed")
-            return
-
-        if signal == 1:
-            # position size based on allocation per trade
-            quantity = round(allocation_per_trade / latest_price, 6)  # Round to 6 decimal places for fractional trading
-            # Check if there is enough cash for the trade
-            if cash < allocation_per_trade:
-                logging.info(f"Not enough cash to execute buy for {symbol}, cash available: {cash}")
+initial_capital = 10000  # Starting with $10,000
+vectorized_signals = True  # Precompute each symbol's whole signal series up front instead of calling generate_signals per bar
+
+def precompute_signals_for_windows(symbol_bars, windows):
+    """ Signal series for one symbol's bars for several windows in one pass, the same signals generate_signals gives
+    bar by bar. Its history holds the last `window` bars and the first diff in it is NaN, so each bar's RSIs cover
+    the window - 1 changes before it. The prefix sums are built once (calculate_indicators_multi_window), so a
+    parameter sweep pays per window, not per parameter combination. Returns {window: NumPy array of -1/0/1}."""
+    close = symbol_bars['close'].to_numpy(dtype=np.float64)
+    volume = symbol_bars['volume'].to_numpy(dtype=np.float64)
+    returns = np.full(len(close), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = close[1:] / close[:-1] - 1
+    usable = [window for window in windows if 2 <= window <= len(close)]  # Neutral until a full history is available
+    indicators = calculate_indicators_multi_window(close, volume, symbol_bars['high'].to_numpy(dtype=np.float64),
+                                                   symbol_bars['low'].to_numpy(dtype=np.float64),
+                                                   [window - 1 for window in usable]) if usable else {}
+    results = {}
+    for window in windows:
+        signals = np.zeros(len(close), dtype=np.int64)
+        if window in usable:
+            rsi = indicators[window - 1]['rsi']
+            volume_rsi = indicators[window - 1]['volume_rsi']
+            with np.errstate(invalid='ignore'):
+                buy = (returns > 0) & (volume_rsi > 50) & (rsi < 70)
+                sell = (returns < 0) & (volume_rsi < 50) & (rsi > 30)
+            signals[window - 1:] = np.where(buy, 1, np.where(sell, -1, 0))[window - 1:]
+        results[window] = signals
+    return results
+
+class BacktestEngine:
+    """One backtest run of the momentum strategy. The engine owns its parameters and all of its state (bar histories,
+    stop levels, cash, positions, risk counters), so independent runs can go side by side in threads or processes.
+    Trades and logged portfolio values are kept on the engine; with log_to_files they also go to the test trade and
+    performance logs, which are shared files and so only suit one run at a time."""
+
+    def __init__(self, symbols, window=window, allocation_per_trade=allocation_per_trade, stop_loss_pct=stop_loss_pct,
+                 take_profit_pct=take_profit_pct, max_daily_loss=max_daily_loss, max_drawdown=max_drawdown,
+                 initial_capital=initial_capital, vectorized_signals=vectorized_signals, log_to_files=True):
+        self.symbols = list(symbols)
+        self.window = window
+        self.allocation_per_trade = allocation_per_trade
+        self.stop_loss_pct = stop_loss_pct
+        self.take_profit_pct = take_profit_pct
+        self.max_daily_loss = max_daily_loss
+        self.max_drawdown = max_drawdown
+        self.initial_capital = initial_capital
+        self.vectorized_signals = vectorized_signals
+        self.log_to_files = log_to_files
+        self.reset()
+
+    def reset(self):
+        # Fresh portfolio, histories and risk counters
+        self.bar_histories = {symbol: BarRingBuffer(self.window) for symbol in self.symbols}  # Last `window` bars per symbol
+        self.stop_loss_levels = {}
+        self.take_profit_levels = {}
+        self.initial_portfolio_value = self.initial_capital
+        self.cash = self.initial_capital
+        self.portfolio = {}
+        self.portfolio_value = self.initial_capital
+        self.portfolio_values = []  # Portfolio value after every trade
+        self.performance_log = []  # [timestamp, portfolio value, cash, positions] every 10 trades, like the performance log
+        self.trades = []  # [timestamp, symbol, action, quantity, price]
+        self.current_daily_loss = 0
+        self.trade_count = 0
+        self.timestamp = None  # Time of the bar being processed (ns, UTC)
+
+    def generate_signals(self, history):
+        if len(history) < self.window:
+            return 0  # Neutral signal if not enough data
+
+        # Columns are views into the ring buffer, no per-bar list copies
+        data = pd.DataFrame({
+            'price': history.close,
+            'volume': history.volume,
+            'high': history.high,
+            'low': history.low
+        })
+        data['returns'] = data['price'].pct_change()
+        data['volume_rsi'] = calculate_volume_rsi(data['volume'], self.window)
+        data['atr'] = calculate_atr(data['high'], data['low'], data['price'], self.window)
+        data['rsi'] = calculate_rsi(data['price'], self.window)
+
+        # Example signal generation with RSI
+        if data['returns'].iloc[-1] > 0 and data['volume_rsi'].iloc[-1] > 50 and data['rsi'].iloc[-1] < 70:
+            signal = 1
+        elif data['returns'].iloc[-1] < 0 and data['volume_rsi'].iloc[-1] < 50 and data['rsi'].iloc[-1] > 30:
+            signal = -1
+        else:
+            signal = 0  # Neutral signal
+
+        logging.info(f"Generated signal: {signal} for {history.close[-1]}, returns: {data['returns'].iloc[-1]}, volume_rsi: {data['volume_rsi'].iloc[-1]}, atr: {data['atr'].iloc[-1]}, rsi: {data['rsi'].iloc[-1]}")
+        return signal
+
+    def precompute_signals(self, symbol_bars):
+        # The whole signal series for one symbol's bars in one vectorized pass, see precompute_signals_for_windows
+        return precompute_signals_for_windows(symbol_bars, [self.window])[self.window]
+
+    def set_stop_loss_take_profit(self, symbol, buy_price):
+        stop_loss_price = round(buy_price * (1 - self.stop_loss_pct), 2)
+        take_profit_price = round(buy_price * (1 + self.take_profit_pct), 2)
+        self.stop_loss_levels[symbol] = stop_loss_price
+        self.take_profit_levels[symbol] = take_profit_price
+        logging.info(f"Set stop loss for {symbol} at {stop_loss_price}, take profit at {take_profit_price}")
+
+    def _record_trade(self, symbol, action, quantity, price):
+        self.trades.append([self.timestamp, symbol, action, quantity, price])
+        if self.log_to_files:
+            log_trade({'symbol': symbol, 'qty': quantity, 'price': price}, action)
+
+    def _record_portfolio_value(self):
+        positions = '; '.join([f"{symbol}: {quantity}" for symbol, quantity in self.portfolio.items()])
+        self.performance_log.append([self.timestamp, self.portfolio_value, self.cash, positions])
+        if self.log_to_files:
+            log_portfolio_value(self.portfolio_value, self.cash, self.portfolio)
+
+    def execute_trade(self, symbol, signal):
+        try:
+            # Calculate current drawdown
+            drawdown = (self.initial_portfolio_value - self.portfolio_value) / self.initial_portfolio_value
+
+            # Check daily loss limit and maximum drawdown
+            if self.current_daily_loss >= self.max_daily_loss * self.initial_portfolio_value or drawdown >= self.max_drawdown:
+                logging.info(f"Risk limits reached. Daily Loss: {self.current_daily_loss}, Drawdown: {drawdown}. No trades executed.")
                 return
 
-            cash -= quantity * latest_price
-            portfolio[symbol] = portfolio.get(symbol, 0) + quantity
-            order = {'symbol': symbol, 'qty': quantity, 'price': latest_price}
-            log_trade(order, 'buy')
-            logging.info(f"Executed buy for {symbol}: {quantity} shares at {latest_price}, remaining cash: {cash}")
-
-            # Set global stop loss and take profit levels
-            set_stop_loss_take_profit(symbol, latest_price)
-
-        elif signal == -1:
-            if symbol not in portfolio or portfolio[symbol] <= 0:
-                logging.info(f"Not enough quantity to execute sell for {symbol}, available: {portfolio.get(symbol, 0)}")
+            if signal == 0:
+                logging.info(f"Neutral signal for {symbol}, no trade executed.")
                 return
 
-            quantity = portfolio[symbol]
-            cash += quantity * latest_price
-            order = {'symbol': symbol, 'qty': quantity, 'price': latest_price}
-            log_trade(order, 'sell')
-            del portfolio[symbol]
-            logging.info(f"Executed sell for {symbol}: {quantity} shares at {latest_price}, updated cash: {cash}")
-
-        # Update current daily loss
-        current_daily_loss += quantity * latest_price if signal == -1 else -quantity * latest_price
-
-        # Update portfolio value
-        portfolio_value = cash + sum([quantity * price_histories[symbol][-1] for symbol, quantity in portfolio.items()])
-        portfolio_values.append(portfolio_value)
-
-        trade_count += 1
-        # Log portfolio value every 10 trades
-        if trade_count % 10 == 0:
-            log_portfolio_value(portfolio_value, cash, portfolio)
-
-    except Exception as e:
-        logging.error(f"Error executing trade for {symbol}: {e}")
+            latest_price = self.bar_histories[symbol].close[-1]  # last price from price history
+            if (latest_price is None) or (latest_price <= 0):
+                logging.error(f"Could not fetch latest price for {symbol}, trade not executed")
+                return
 
-def backtest_strategy(symbols, start_date, end_date):
-    global cash, portfolio, portfolio_value
-    cash, portfolio, portfolio_value = get_portfolio()  # Initialize portfolio
-    
-    for symbol in symbols:
-        bars = api.get_bars(symbol, tradeapi.rest.TimeFrame.Minute, start=start_date, end=end_date, feed='iex').df
-        for i in range(len(bars)):
-            bar = bars.iloc[i]
-            price_histories[symbol].append(bar.close)
-            volume_histories[symbol].append(bar.volume)
-            high_histories[symbol].append(bar.high)
-            low_histories[symbol].append(bar.low)
-
-            if len(price_histories[symbol]) > window:
-                price_histories[symbol].pop(0)
-                volume_histories[symbol].pop(0)
-                high_histories[symbol].pop(0)
-                low_histories[symbol].pop(0)
-
-            signal = generate_signals(price_histories[symbol], volume_histories[symbol], high_histories[symbol], low_histories[symbol])
-            if signal is not None:
-                logging.info(f"Current portfolio for {symbol}: {portfolio.get(symbol, 0)}, Cash: {cash}, Portfolio Value: {portfolio_value}")
-                execute_trade(symbol, signal, portfolio, cash, portfolio_value)
-
-            # Check for stop loss or take profit triggers
-            if symbol in stop_loss_levels and symbol in take_profit_levels:
-                latest_price = price_histories[symbol][-1]
-                if latest_price is not None:
-                    if latest_price <= stop_loss_levels[symbol] or latest_price >= take_profit_levels[symbol]:
-                        execute_trade(symbol, -1, portfolio, cash, portfolio_value)
+            if signal == 1:
+                # position size based on allocation per trade
+                quantity = round(self.allocation_per_trade / latest_price, 6)  # Round to 6 decimal places for fractional trading
+                # Check if there is enough cash for the trade
+                if self.cash < self.allocation_per_trade:
+                    logging.info(f"Not enough cash to execute buy for {symbol}, cash available: {self.cash}")
+                    return
+
+                self.cash -= quantity * latest_price
+                self.portfolio[symbol] = self.portfolio.get(symbol, 0) + quantity
+                self._record_trade(symbol, 'buy', quantity, latest_price)
+                logging.info(f"Executed buy for {symbol}: {quantity} shares at {latest_price}, remaining cash: {self.cash}")
+
+                self.set_stop_loss_take_profit(symbol, latest_price)
+
+            elif signal == -1:
+                if symbol not in self.portfolio or self.portfolio[symbol] <= 0:
+                    logging.info(f"Not enough quantity to execute sell for {symbol}, available: {self.portfolio.get(symbol, 0)}")
+                    return
+
+                quantity = self.portfolio[symbol]
+                self.cash += quantity * latest_price
+                self._record_trade(symbol, 'sell', quantity, latest_price)
+                del self.portfolio[symbol]
+                logging.info(f"Executed sell for {symbol}: {quantity} shares at {latest_price}, updated cash: {self.cash}")
+
+            # Update current daily loss
+            self.current_daily_loss += quantity * latest_price if signal == -1 else -quantity * latest_price
+
+            # Update portfolio value
+            self.portfolio_value = self.cash + sum([quantity * self.bar_histories[symbol].close[-1] for symbol, quantity in self.portfolio.items()])
+            self.portfolio_values.append(self.portfolio_value)
+
+            self.trade_count += 1
+            # Log portfolio value every 10 trades
+            if self.trade_count % 10 == 0:
+                self._record_portfolio_value()
+
+        except Exception as e:
+            logging.error(f"Error executing trade for {symbol}: {e}")
+
+    def on_bar(self, symbol, timestamp, close, volume, high, low, signal=None):
+        """ Strategy callback for one bar; the replay engine calls it for all symbols in timestamp order.
+        signal is the precomputed signal in vectorized mode, otherwise it is generated here from the bar history."""
+        self.timestamp = timestamp
+        self.bar_histories[symbol].append(close, volume, high, low)
+
+        signal = self.generate_signals(self.bar_histories[symbol]) if signal is None else int(signal)
+        if signal is not None:
+            logging.info(f"Current portfolio for {symbol}: {self.portfolio.get(symbol, 0)}, Cash: {self.cash}, Portfolio Value: {self.portfolio_value}")
+            self.execute_trade(symbol, signal)
+
+        # Check for stop loss or take profit triggers
+        if symbol in self.stop_loss_levels and symbol in self.take_profit_levels:
+            latest_price = self.bar_histories[symbol].close[-1]
+            if latest_price is not None:
+                if latest_price <= self.stop_loss_levels[symbol] or latest_price >= self.take_profit_levels[symbol]:
+                    self.execute_trade(symbol, -1)
+
+    def run(self, bars, signals=None):
+        """ Replays all symbols' bars together in timestamp order, so cash and risk limits see every symbol's bars
+        as they would have arrived live. bars: {symbol: minute bars DataFrame} (see load_bars).
+        With vectorized_signals the signals are precomputed, leaving only order, stop and portfolio logic per bar.
+        signals: optional {symbol: signal array for this window}, e.g. computed once per window for a whole sweep.
+        Returns the replay stats (bars, seconds, bars_per_second)."""
+        if not self.vectorized_signals and signals is None:
+            return replay(bars, self.on_bar, self.symbols)
+
+        # Signals ride along with the bars as one more column
+        with_signals = {}
+        for symbol in self.symbols:
+            with_signals[symbol] = bars[symbol][list(BAR_FIELDS)].copy()
+            with_signals[symbol]['signal'] = signals[symbol] if signals is not None else self.precompute_signals(bars[symbol])
+        return replay(with_signals, self.on_bar, self.symbols, BAR_FIELDS + ('signal',))
+
+    def performance_frame(self):
+        # The logged portfolio values as a DataFrame with the performance log's columns (bar time as Timestamp)
+        frame = pd.DataFrame(self.performance_log, columns=['Timestamp', 'Portfolio Value', 'Cash Balance', 'Positions'])
+        frame['Timestamp'] = pd.to_datetime(frame['Timestamp'], unit='ns', utc=True)
+        return frame
+
+def get_bars(symbol, start_date, end_date):
+    # Minute bars from the local bar store; only dates it doesn't have yet are fetched from the API (none in offline mode)
+    return get_bar_store().get(symbol, 'minute', start_date, end_date, alpaca_fetcher(api))
+
+def load_bars(symbols, start_date, end_date):
+    # Minute bars per symbol, loaded once so a parameter sweep can share them between runs
+    return {symbol: get_bars(symbol, start_date, end_date) for symbol in symbols}
+
+def backtest_strategy(symbols, start_date, end_date, bars=None, **params):
+    """ Runs one backtest with the default parameters, overridden by params (see BacktestEngine), and returns the engine.
+    bars: optional {symbol: minute bars DataFrame} (see load_bars), fetched when not given."""
+    if bars is None:
+        bars = load_bars(symbols, start_date, end_date)
+    engine = BacktestEngine(symbols, **params)
+    engine.run(bars)
+    return engine
 
 if __name__ == "__main__":
     initialize_trade_log()
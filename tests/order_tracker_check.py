@@ -0,0 +1,99 @@
+#tests
+# Drives trade_log.OrderTracker with a fake trade-updates stream (fill, partial_fill, cancel events shaped like Alpaca's)
+# and checks that order futures resolve, that late track() calls get a resolved future, what the trade log records,
+# and that orders whose final event never arrives are resolved by reconcile() from get_order.
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+import alpaca_trade_api as tradeapi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Shared modules live in the project root
+from trade_log import OrderTracker, MemoryTradeLog, set_trade_log_sink
+
+def order(order_id, status, qty, filled_qty, filled_avg_price, side='buy', symbol='AAPL'):
+    return {'id': order_id, 'symbol': symbol, 'side': side, 'status': status, 'qty': str(qty),
+            'filled_qty': str(filled_qty), 'filled_avg_price': None if filled_avg_price is None else str(filled_avg_price)}
+
+class FakeOrdersAPI:
+    """Stands in for the REST client in OrderTracker.reconcile: get_order returns the broker's view of an order."""
+
+    def __init__(self, orders):
+        self.orders = orders
+        self.requested = []
+
+    def get_order(self, order_id):
+        self.requested.append(order_id)
+        return tradeapi.entity.Order(self.orders[order_id])
+
+class FakeTradeStream:
+    """Stands in for Stream.subscribe_trade_updates: feeds trade-update events to the registered handler."""
+
+    def __init__(self):
+        self.handler = None
+
+    def subscribe_trade_updates(self, handler):
+        self.handler = handler
+
+    async def send(self, event, order, qty=None, price=None):
+        await self.handler(SimpleNamespace(event=event, order=order, qty=qty, price=price))
+
+async def check():
+    sink = set_trade_log_sink(MemoryTradeLog())
+    tracker = OrderTracker()
+    stream = FakeTradeStream()
+    stream.subscribe_trade_updates(tracker.on_trade_update)
+    seen = []
+
+    async def listener(data):
+        seen.append(data.event)
+    tracker.add_listener(listener)
+
+    # Filled in two parts: the future resolves only on the final fill, with the average fill price
+    filled = tracker.track('o1')
+    await stream.send('new', order('o1', 'new', 10, 0, None))
+    await stream.send('partial_fill', order('o1', 'partially_filled', 10, 4, 100.0), qty=4, price=100.0)
+    assert not filled.done(), "partial fill resolved the order"
+    await stream.send('fill', order('o1', 'filled', 10, 10, 100.6), qty=6, price=101.0)
+    assert filled.done() and filled.result().status == 'filled'
+
+    # Partly filled, then canceled: resolves on the cancel and logs only the filled quantity
+    canceled = tracker.track('o2')
+    await stream.send('partial_fill', order('o2', 'partially_filled', 10, 3, 50.0), qty=3, price=50.0)
+    await stream.send('canceled', order('o2', 'canceled', 10, 3, 50.0))
+    assert canceled.result(timeout=0).status == 'canceled'
+
+    # The fill arrives before submit_order returns: a late track() gets a resolved future and nothing is kept
+    await stream.send('fill', order('o3', 'filled', 5, 5, 20.0, side='sell'), qty=5, price=20.0)
+    late = tracker.track('o3')
+    assert late.done() and late.result().id == 'o3'
+    assert 'o3' not in tracker._futures and not tracker._futures, f"futures left behind: {list(tracker._futures)}"
+    assert tracker.wait_for_fill('o3', timeout=0).filled_avg_price == '20.0'
+
+    # Canceled with nothing filled: resolves, but is not a trade
+    unfilled = tracker.track('o4')
+    await stream.send('canceled', order('o4', 'canceled', 10, 0, None))
+    assert unfilled.result(timeout=0).status == 'canceled'
+
+    # The fill event is lost (e.g. a stream reconnect): reconcile() resolves stale orders from get_order, only once
+    tracker.stale_after = 0
+    lost = tracker.track('o5')
+    waiting = tracker.track('o6')
+    api = FakeOrdersAPI({'o5': order('o5', 'filled', 2, 2, 30.0), 'o6': order('o6', 'new', 1, 0, None)})
+    assert tracker.reconcile(api) == 1 and sorted(api.requested) == ['o5', 'o6']
+    assert lost.result(timeout=0).status == 'filled' and not waiting.done()
+    await stream.send('fill', order('o5', 'filled', 2, 2, 30.0), qty=2, price=30.0)  # Arrives after all: not logged twice
+    assert list(tracker._futures) == ['o6'], f"futures left behind: {list(tracker._futures)}"
+
+    logged = [(row[1], row[2], row[3], row[4], row[5], row[6]) for row in sink.rows]
+    expected = [('AAPL', 'buy', '10', '100.6', 'o1', 'filled'),
+                ('AAPL', 'buy', '3', '50.0', 'o2', 'canceled'),
+                ('AAPL', 'sell', '5', '20.0', 'o3', 'filled'),
+                ('AAPL', 'buy', '2', '30.0', 'o5', 'filled')]
+    assert logged == expected, f"trade log rows {logged} != {expected}"
+    assert seen == ['new', 'partial_fill', 'fill', 'partial_fill', 'canceled', 'fill', 'canceled', 'fill'], f"listener saw {seen}"
+    assert not tracker.orders, f"open orders left behind: {list(tracker.orders)}"
+    print(f"OrderTracker: {len(expected)} orders resolved and logged, {len(seen)} events forwarded")
+
+if __name__ == "__main__":
+    asyncio.run(check())
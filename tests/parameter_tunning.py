@@ -1,11 +1,15 @@
 import itertools
+import os
+import sys
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import time
 import logging
-from momentum_strategy_backtest import initialize_trade_log, initialize_performance_log, backtest_strategy, symbols
+import momentum_strategy_backtest
+from momentum_strategy_backtest import BacktestEngine, load_bars, symbols, precompute_signals_for_windows
 from test_performance_metrics import calculate_metrics
+from sweep_runner import run_sweep, code_version
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -23,81 +27,103 @@ param_grid = {
 # Use only one symbol for initial tuning
 initial_test_symbol = symbols[:1]
 
-# Function to run the backtest with given parameters and calculate performance metrics
-def run_backtest(params, test_symbols):
-    global window, allocation_per_trade, stop_loss_pct, take_profit_pct
-    window = params['window']
-    allocation_per_trade = params['allocation_per_trade']
-    stop_loss_pct = params['stop_loss_pct']
-    take_profit_pct = params['take_profit_pct']
+sweep_workers = os.cpu_count()  # Backtests run in parallel, one per core
+INITIAL_PROGRESS_FILE = 'tests/logs/parameter_tuning_initial.jsonl'  # Finished runs, so an interrupted sweep resumes
+VALIDATION_PROGRESS_FILE = 'tests/logs/parameter_tuning_validation.jsonl'
+
+def sweep_run_key(test_symbols):
+    # Everything besides the parameters and bars that the results depend on; progress files from other runs aren't resumed
+    return {'start': start_date, 'end': end_date, 'symbols': list(test_symbols),
+            'code': code_version(sys.modules[__name__], momentum_strategy_backtest, sys.modules['replay_engine'], sys.modules['indicators'])}
+
+def signal_frames(bars, windows):
+    """ {"{symbol}:signals": DataFrame with one signal column per window}, computed once before the sweep and shared
+    with the workers alongside the bars, so signal cost scales with the windows, not the parameter combinations."""
+    return {f"{symbol}:signals": pd.DataFrame(precompute_signals_for_windows(frame, windows), index=frame.index)
+            for symbol, frame in bars.items()}
 
-    # Reset logs
-    initialize_trade_log()
-    initialize_performance_log()
+def sweep_frames(bars, test_symbols):
+    # The bars run_sweep shares with the workers: each symbol's minute bars plus its signals for every grid window
+    frames = {symbol: bars[symbol] for symbol in test_symbols}
+    frames.update(signal_frames(frames, param_grid['window']))
+    return frames
+
+# Function to run the backtest with given parameters and calculate performance metrics
+def run_backtest(params, test_symbols, bars=None, signals=None):
+    # Each run gets its own engine configured with params; trades and portfolio values stay in memory on the engine
+    if bars is None:
+        bars = load_bars(test_symbols, start_date, end_date)
+    engine = BacktestEngine(test_symbols, log_to_files=False, **params)
 
     logging.info(f"Running backtest for symbols: {test_symbols} with parameters: {params}")
     
     start_time = time.time()
-    backtest_strategy(test_symbols, start_date, end_date)
+    engine.run(bars, signals)
     end_time = time.time()
     
     elapsed_time = end_time - start_time
     logging.info(f"Backtest completed in {elapsed_time:.2f} seconds for parameters: {params} with symbols: {test_symbols}")
 
-    # Read performance log and calculate metrics
-    performance_log = pd.read_csv('tests/logs/performance_log.csv')
+    # Calculate metrics from the portfolio values the engine logged
+    performance_log = engine.performance_frame()
+    if len(performance_log) < 2:
+        logging.info(f"Too few trades to measure parameters: {params} with symbols: {test_symbols}")
+        return params, np.nan, 'Insufficient data', np.nan, elapsed_time
     cumulative_return = (performance_log['Portfolio Value'].iloc[-1] - performance_log['Portfolio Value'].iloc[0]) / performance_log['Portfolio Value'].iloc[0]
     sharpe_ratio, max_dd = calculate_metrics(performance_log)
     
     return params, cumulative_return, sharpe_ratio, max_dd, elapsed_time
 
-# Generate all combinations of parameters
-param_combinations = [dict(zip(param_grid.keys(), values)) for values in itertools.product(*param_grid.values())]
-
-# Evaluate each combination using the initial symbol
-results = []
-total_time = 0
-for idx, params in enumerate(param_combinations):
-    print(f"Running backtest {idx+1}/{len(param_combinations)} with parameters: {params}")
-    result = run_backtest(params, initial_test_symbol)
-    results.append(result)
-    total_time += result[-1]
-
-# the best parameters based on cumulative return
-best_params, best_performance, best_sharpe, best_max_dd, _ = max(results, key=lambda x: x[1])
-print(f"Best Parameters: {best_params}")
-print(f"Best Performance (Cumulative Return): {best_performance}")
-print(f"Best Sharpe Ratio: {best_sharpe}")
-print(f"Best Max Drawdown: {best_max_dd}")
-print(f"Total time taken: {total_time:.2f} seconds")
-
-# Save initial results to a file for further analysis
-results_df = pd.DataFrame(results, columns=['Parameters', 'Cumulative Return', 'Sharpe Ratio', 'Max Drawdown', 'Time'])
-results_df.to_csv('tests/logs/parameter_tuning_results_initial.csv', index=False)
+def sweep_task(task, frames):
+    # One backtest for run_sweep: task holds the parameters and symbols, frames the shared bars and signals (see sweep_frames)
+    window = task['params']['window']
+    signals = {symbol: frames[f"{symbol}:signals"][window].to_numpy(dtype=np.int64) for symbol in task['symbols']}
+    _, cumulative_return, sharpe_ratio, max_dd, elapsed_time = run_backtest(task['params'], task['symbols'], frames, signals)
+    return [cumulative_return, sharpe_ratio, max_dd, elapsed_time]
 
 # Validate the best parameters across multiple symbols
-def validate_across_symbols(best_params):
-    validation_results = []
-    for symbol in symbols:
-        test_symbols = [symbol]
-        print(f"Validating for symbol: {symbol} with parameters: {best_params}")
-        logging.info(f"Validating for symbol: {symbol} with parameters: {best_params}")
-        params, cumulative_return, sharpe_ratio, max_dd, elapsed_time = run_backtest(best_params, test_symbols)
-        validation_results.append((symbol, params, cumulative_return, sharpe_ratio, max_dd, elapsed_time))
-    
-    return validation_results
-
-validation_results = validate_across_symbols(best_params)
-
-# Print validation results
-for result in validation_results:
-    symbol, params, cumulative_return, sharpe_ratio, max_dd, elapsed_time = result
-    print(f"Symbol: {symbol}")
-    print(f"Cumulative Return: {cumulative_return}")
-    print(f"Sharpe Ratio: {sharpe_ratio}")
-    print(f"Max Drawdown: {max_dd}")
-    print(f"Time taken: {elapsed_time:.2f} seconds")
-
-# Save validation results to a file for further analysis
-validation_results_df = pd.DataFrame(validation_results, columns=['Symbol', 'Parameters', 'Cumulative Return', 'Sharpe Ratio', 'Max Drawdown', 'Time'])
-validation_results_df.to_csv('tests/logs/parameter_tuning_validation_results.csv', index=False)
+def validate_across_symbols(best_params, bars):
+    tasks = [{'params': best_params, 'symbols': [symbol]} for symbol in symbols]
+    logging.info(f"Validating {len(tasks)} symbols with parameters: {best_params}")
+    outcomes = run_sweep(sweep_task, tasks, sweep_frames(bars, symbols), sweep_workers, VALIDATION_PROGRESS_FILE, run_key=sweep_run_key(symbols))
+    return [(symbol, best_params, *outcome) for symbol, outcome in zip(symbols, outcomes)]
+
+if __name__ == "__main__":
+    # Minute bars for every symbol are fetched once and shared with the workers
+    bars = load_bars(symbols, start_date, end_date)
+
+    # Generate all combinations of parameters
+    param_combinations = [dict(zip(param_grid.keys(), values)) for values in itertools.product(*param_grid.values())]
+
+    # Evaluate each combination using the initial symbol, results come back in param_combinations order
+    tasks = [{'params': params, 'symbols': initial_test_symbol} for params in param_combinations]
+    outcomes = run_sweep(sweep_task, tasks, sweep_frames(bars, initial_test_symbol), sweep_workers, INITIAL_PROGRESS_FILE, run_key=sweep_run_key(initial_test_symbol))
+    results = [(params, *outcome) for params, outcome in zip(param_combinations, outcomes)]
+    total_time = sum(result[-1] for result in results)
+
+    # the best parameters based on cumulative return
+    best_params, best_performance, best_sharpe, best_max_dd, _ = max(results, key=lambda x: -np.inf if np.isnan(x[1]) else x[1])
+    print(f"Best Parameters: {best_params}")
+    print(f"Best Performance (Cumulative Return): {best_performance}")
+    print(f"Best Sharpe Ratio: {best_sharpe}")
+    print(f"Best Max Drawdown: {best_max_dd}")
+    print(f"Total time taken: {total_time:.2f} seconds")
+
+    # Save initial results to a file for further analysis
+    results_df = pd.DataFrame(results, columns=['Parameters', 'Cumulative Return', 'Sharpe Ratio', 'Max Drawdown', 'Time'])
+    results_df.to_csv('tests/logs/parameter_tuning_results_initial.csv', index=False)
+
+    validation_results = validate_across_symbols(best_params, bars)
+
+    # Print validation results
+    for result in validation_results:
+        symbol, params, cumulative_return, sharpe_ratio, max_dd, elapsed_time = result
+        print(f"Symbol: {symbol}")
+        print(f"Cumulative Return: {cumulative_return}")
+        print(f"Sharpe Ratio: {sharpe_ratio}")
+        print(f"Max Drawdown: {max_dd}")
+        print(f"Time taken: {elapsed_time:.2f} seconds")
+
+    # Save validation results to a file for further analysis
+    validation_results_df = pd.DataFrame(validation_results, columns=['Symbol', 'Parameters', 'Cumulative Return', 'Sharpe Ratio', 'Max Drawdown', 'Time'])
+    validation_results_df.to_csv('tests/logs/parameter_tuning_validation_results.csv', index=False)
@@ -0,0 +1,132 @@
+#tests
+# Runs request_scheduler.ScheduledAPI around a real alpaca_trade_api REST client pointed at a local http.server stand-in
+# for the broker, and checks coalescing, priority ordering, dropped reads and the counters against the requests the
+# server actually received.
+import json
+import os
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import alpaca_trade_api as tradeapi
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Shared modules live in the project root
+from request_scheduler import RequestScheduler, ScheduledAPI, RequestDropped
+
+class FakeBroker(BaseHTTPRequestHandler):
+    """Answers the few trading API endpoints the checks use and records every request it receives."""
+    received = []
+    delay = 0.0  # Seconds each response takes, so identical reads overlap
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        time.sleep(self.delay)
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        with self.lock:
+            self.received.append(('GET', self.path))
+        if self.path.startswith('/v2/positions/'):
+            self._reply({'symbol': self.path.rsplit('/', 1)[-1], 'qty': '1', 'current_price': '100'})
+        else:
+            self._reply({'id': 'account', 'cash': '1000', 'equity': '1000', 'status': 'ACTIVE'})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with self.lock:
+            self.received.append(('POST', self.path))
+        self._reply({'id': f"order-{body['symbol']}", 'symbol': body['symbol'], 'qty': body['qty'], 'side': body['side'], 'status': 'new'})
+
+def start_broker():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeBroker)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def scheduled_api(server, scheduler):
+    rest = tradeapi.REST('key', 'secret', f"http://127.0.0.1:{server.server_port}", api_version='v2')
+    return ScheduledAPI(rest, scheduler)
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    return threads
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("condition not reached")
+        time.sleep(0.005)
+
+def drain(scheduler):
+    # Uses up the burst so the next requests have to queue for tokens
+    while scheduler._tokens >= 1:
+        scheduler.call(0, lambda: None)
+
+def check_coalescing(server):
+    FakeBroker.received.clear()
+    FakeBroker.delay = 0.2
+    scheduler = RequestScheduler(rate_per_minute=600, burst=10)
+    api = scheduled_api(server, scheduler)
+    results = []
+    for thread in run_threads([lambda: results.append(api.get_account().cash)] * 10):
+        thread.join()
+    FakeBroker.delay = 0.0
+    stats = scheduler.stats()
+    assert FakeBroker.received == [('GET', '/v2/account')], f"broker saw {FakeBroker.received}"
+    assert results == ['1000'] * 10
+    assert stats['executed'] == 1 and stats['coalesced'] == 9, stats
+    print(f"coalescing: 10 concurrent get_account calls, 1 HTTP request, counters {stats}")
+
+def check_priority(server):
+    FakeBroker.received.clear()
+    scheduler = RequestScheduler(rate_per_minute=120, burst=1)  # One token every 0.5s
+    api = scheduled_api(server, scheduler)
+    drain(scheduler)
+    reads = run_threads([lambda symbol=symbol: api.get_position(symbol) for symbol in ('AAPL', 'MSFT', 'GOOG')])
+    wait_until(lambda: scheduler.counters['queued'] == 3)
+    order = run_threads([lambda: api.submit_order(symbol='SPY', qty=1, side='buy', type='market', time_in_force='day')])
+    for thread in reads + order:
+        thread.join()
+    stats = scheduler.stats()
+    assert FakeBroker.received[0] == ('POST', '/v2/orders'), f"order did not go first: {FakeBroker.received}"
+    assert sorted(FakeBroker.received[1:]) == [('GET', f"/v2/positions/{symbol}") for symbol in ('AAPL', 'GOOG', 'MSFT')]
+    assert stats['throttled'] == 4 and stats['queued'] == 0, stats
+    print(f"priority: order sent ahead of 3 queued reads, broker saw {[path for _, path in FakeBroker.received]}")
+
+def check_dropped(server):
+    FakeBroker.received.clear()
+    scheduler = RequestScheduler(rate_per_minute=120, burst=1, max_queued_reads=2)
+    api = scheduled_api(server, scheduler)
+    drain(scheduler)
+    reads = run_threads([lambda symbol=symbol: api.get_position(symbol) for symbol in ('AAPL', 'MSFT')])
+    wait_until(lambda: scheduler.counters['queued'] == 2)
+    try:
+        api.get_position('GOOG')
+        raise AssertionError("third read was queued past max_queued_reads")
+    except RequestDropped:
+        pass
+    for thread in reads:
+        thread.join()
+    stats = scheduler.stats()
+    assert ('GET', '/v2/positions/GOOG') not in FakeBroker.received and len(FakeBroker.received) == 2, FakeBroker.received
+    assert stats['dropped'] == 1 and stats['executed'] == 2 + 1, stats  # The two reads plus the drained token
+    print(f"dropped: read beyond max_queued_reads rejected without a request, counters {stats}")
+
+if __name__ == "__main__":
+    server = start_broker()
+    try:
+        check_coalescing(server)
+        check_priority(server)
+        check_dropped(server)
+    finally:
+        server.shutdown()
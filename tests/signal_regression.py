@@ -0,0 +1,63 @@
+#tests
+# Checks that the backtest's vectorized signal precomputation gives the same signal sequence as generate_signals
+# run bar by bar, and that whole backtests in both modes end with the same trades and portfolio.
+# Uses synthetic random-walk minute bars (regular hours, one month), so it runs offline.
+import logging
+import sys
+import time
+import numpy as np
+import pandas as pd
+import momentum_strategy_backtest as backtest
+from bar_buffer import BarRingBuffer
+
+def synthetic_bars(days=21, seed=0):
+    rng = np.random.default_rng(seed)
+    sessions = pd.bdate_range('2024-01-02', periods=days)
+    minutes = pd.timedelta_range('14:30:00', periods=390, freq='min')
+    index = pd.DatetimeIndex((sessions.values[:, None] + minutes.values[None, :]).ravel()).tz_localize('UTC')
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.001, len(index)))), 2)
+    spread = np.round(rng.uniform(0, 0.1, len(index)), 2)
+    volume = rng.integers(100, 5000, len(index)).astype(np.float64)
+    return pd.DataFrame({'open': close, 'high': close + spread, 'low': close - spread, 'close': close, 'volume': volume}, index=index)
+
+def per_bar_signals(engine, symbol_bars):
+    history = BarRingBuffer(engine.window)
+    signals = np.empty(len(symbol_bars), dtype=np.int64)
+    for i, (close, volume, high, low) in enumerate(symbol_bars[['close', 'volume', 'high', 'low']].to_numpy()):
+        history.append(close, volume, high, low)
+        signals[i] = engine.generate_signals(history)
+    return signals
+
+def check_signals(symbol_bars, windows=(2, 15, 20, 25, 30)):
+    ok = True
+    for window in windows:
+        engine = backtest.BacktestEngine(['TEST'], window=window, log_to_files=False)
+        expected = per_bar_signals(engine, symbol_bars)
+        actual = engine.precompute_signals(symbol_bars)
+        mismatches = int((expected != actual).sum())
+        print(f"window {window}: {len(expected):,} bars, {int((expected != 0).sum()):,} signals, {mismatches} mismatches")
+        ok &= mismatches == 0
+    return ok
+
+def run_backtest(bars, vectorized):
+    engine = backtest.BacktestEngine(list(bars), vectorized_signals=vectorized, log_to_files=False)
+    start = time.perf_counter()
+    stats = engine.run(bars)
+    elapsed = time.perf_counter() - start
+    result = (engine.trades, round(engine.cash, 6), engine.portfolio, engine.portfolio_values)
+    print(f"  {'vectorized' if vectorized else 'per-bar':10}: {elapsed:8.2f}s, {stats['bars_per_second']:10,.0f} bars/s, {engine.trade_count} trades")
+    return result
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)  # Per-bar INFO logging would dominate the timings
+    ok = check_signals(synthetic_bars(days=5))
+
+    # Full backtests on one month of minute bars; the per-bar path is only run on the first days, it is slow
+    month = {symbol: synthetic_bars(seed=seed) for seed, symbol in enumerate(['AAPL', 'MSFT', 'GOOG', 'NVDA', 'JPM'])}
+    print(f"Backtest, {sum(len(bars) for bars in month.values()):,} minute bars:")
+    run_backtest(month, vectorized=True)
+    first_days = {symbol: bars.iloc[:390 * 2] for symbol, bars in month.items()}
+    print(f"Backtest, {sum(len(bars) for bars in first_days.values()):,} minute bars, both modes:")
+    same = run_backtest(first_days, vectorized=True) == run_backtest(first_days, vectorized=False)
+    print(f"  identical trades and portfolio: {same}")
+    sys.exit(0 if ok and same else 1)
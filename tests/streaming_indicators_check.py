@@ -0,0 +1,79 @@
+#tests
+# Streams random bars through indicators.StreamingIndicators and the live strategy's bar history, and checks after every
+# bar that RSI and Volume RSI equal calculate_rsi / calculate_volume_rsi over the last `window` bars (what generate_signals
+# computed before it was made incremental), and that generate_signals and generate_batch_signals give the old signals.
+# Runs offline from the project root (momentum_strategy needs ALPACA_API_KEY/ALPACA_SECRET_KEY set, any value works).
+import contextlib
+import io
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Shared modules live in the project root
+from indicators import StreamingIndicators, calculate_rsi, calculate_volume_rsi, calculate_atr
+import momentum_strategy as strategy
+
+TOLERANCE = 1e-9  # Running sums vs pandas rolling sums
+
+def random_bars(count, seed):
+    rng = np.random.default_rng(seed)
+    close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.002, count))), 2)
+    spread = np.round(rng.uniform(0, 0.1, count), 2)
+    volume = rng.integers(100, 5000, count).astype(np.float64)
+    volume[rng.random(count) < 0.05] = volume[0]  # Some unchanged volumes, for zero diffs
+    return close, volume, close + spread, close - spread
+
+def old_indicators(close, volume, high, low, window):
+    # What generate_signals computed from its last `window` bars before StreamingIndicators
+    data = pd.DataFrame({'price': close[-window:], 'volume': volume[-window:], 'high': high[-window:], 'low': low[-window:]})
+    returns = data['price'].pct_change().iloc[-1]
+    volume_rsi = calculate_volume_rsi(data['volume'], window).iloc[-1]
+    atr = calculate_atr(data['high'], data['low'], data['price'], window).iloc[-1]
+    rsi = calculate_rsi(data['price'], window).iloc[-1]
+    return returns, volume_rsi, atr, rsi
+
+def same(a, b):
+    return (np.isnan(a) and np.isnan(b)) or abs(a - b) <= TOLERANCE
+
+def check_streaming(windows=(2, 5, 14, 30), bars=3000):
+    ok = True
+    for window in windows:
+        close, volume, high, low = random_bars(bars, window)
+        indicators = StreamingIndicators(window)
+        mismatches = signals = 0
+        for i in range(bars):
+            indicators.update(close[i], volume[i], high[i], low[i])
+            if i + 1 < window:
+                assert not indicators.ready
+                continue
+            returns, volume_rsi, atr, rsi = old_indicators(close[:i + 1], volume[:i + 1], high[:i + 1], low[:i + 1], window)
+            values = (indicators.returns, indicators.volume_rsi, indicators.atr, indicators.rsi)
+            mismatches += not all(same(a, b) for a, b in zip(values, (returns, volume_rsi, atr, rsi)))
+            old_signal = int(strategy.signal_rule(returns, volume_rsi, rsi))
+            with contextlib.redirect_stdout(io.StringIO()):
+                mismatches += strategy.generate_signals(indicators) != old_signal
+            signals += old_signal != 0
+        print(f"window {window}: {bars - window + 1:,} bars compared, {signals:,} signals, {mismatches} mismatches")
+        ok &= mismatches == 0
+    return ok
+
+def check_batch(bars=300):
+    # generate_batch_signals over the bar histories must agree with generate_signals on each symbol
+    series = {symbol: random_bars(bars, seed) for seed, symbol in enumerate(strategy.symbols)}
+    mismatches = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(bars):
+            for symbol, (close, volume, high, low) in series.items():
+                strategy.record_bar(SimpleNamespace(symbol=symbol, close=close[i], volume=volume[i], high=high[i], low=low[i]))
+            batch = strategy.generate_batch_signals(strategy.symbols)
+            for symbol in strategy.symbols:
+                mismatches += batch[symbol] != strategy.generate_signals(strategy.indicator_engines[symbol])
+    print(f"batch: {bars} minutes x {len(strategy.symbols)} symbols, {mismatches} mismatches")
+    return mismatches == 0
+
+if __name__ == "__main__":
+    ok = check_streaming()
+    ok &= check_batch()
+    sys.exit(0 if ok else 1)
@@ -4,15 +4,20 @@ from dotenv import load_dotenv
 from datetime import datetime, timedelta
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
 import alpaca_trade_api as tradeapi
 import logging
+from report_engine import build_report
+from chart_renderer import render_charts
 
 load_dotenv()
 
 # Path to the performance metrics log file
 PERFORMANCE_LOG_FILE = 'tests/logs/performance_log.csv'
 REPORT_FILE = 'tests/logs/trading_strategy_report.txt'
+REPORT_JSON_FILE = 'tests/logs/trading_strategy_report.json'
+REPORT_CHUNK_ROWS = 100000
+CHART_DIR = 'tests/logs'
+CHARTS_IN_BACKGROUND = True
 
 # Alpaca API credentials (replace with your own)
 ALPACA_API_KEY = os.getenv('ALPACA_API_KEY')
@@ -77,96 +82,18 @@ def period_metrics(df, period):
 
     return initial_value, final_value, cumulative_return, sharpe_ratio, max_drawdown
 
-def generate_report():
+def generate_report(chunk_rows=REPORT_CHUNK_ROWS, background_charts=CHARTS_IN_BACKGROUND):
     if not os.path.exists(PERFORMANCE_LOG_FILE):
         raise FileNotFoundError(f"{PERFORMANCE_LOG_FILE} not found.")
 
-    df = pd.read_csv(PERFORMANCE_LOG_FILE, parse_dates=['Timestamp'], index_col='Timestamp')
+    # One pass over the log for every period, streamed chunk_rows rows at a time
+    chunks = ((pd.to_datetime(chunk['Timestamp']).to_numpy(), pd.to_numeric(chunk['Portfolio Value'], errors='coerce').to_numpy(dtype=np.float64))
+              for chunk in pd.read_csv(PERFORMANCE_LOG_FILE, usecols=['Timestamp', 'Portfolio Value'], chunksize=chunk_rows))
+    _, chart_data = build_report(chunks, REPORT_FILE, REPORT_JSON_FILE)
+    return generate_charts(chart_data, background_charts)  # Chart process when rendering in the background
 
-    start_time = df.index.min()
-    end_time = df.index.max()
-    duration = end_time - start_time
-
-    # Ensure sufficient data points
-    if len(df) < 2:
-        raise ValueError("Not enough data to generate report")
-
-    # Metrics for each period
-    daily_initial, daily_final, daily_cum_return, daily_sharpe, daily_drawdown = period_metrics(df, 'D')
-    weekly_initial, weekly_final, weekly_cum_return, weekly_sharpe, weekly_drawdown = period_metrics(df, 'W')
-    monthly_initial, monthly_final, monthly_cum_return, monthly_sharpe, monthly_drawdown = period_metrics(df, 'MS')
-    yearly_initial, yearly_final, yearly_cum_return, yearly_sharpe, yearly_drawdown = period_metrics(df, 'YS')
-
-    with open(REPORT_FILE, 'w') as report:
-        report.write(f"Trading Strategy Report\n")
-        report.write(f"{'='*23}\n\n")
-        
-        report.write(f"Running Period:\n")
-        report.write(f"{'-'*16}\n")
-        report.write(f"Start Time: {start_time}\n")
-        report.write(f"End Time: {end_time}\n")
-        report.write(f"Total Duration: {duration}\n\n")
-
-        report.write(f"Daily Performance:\n")
-        report.write(f"{'-'*19}\n")
-        report.write(f"Initial Portfolio Value: {daily_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {daily_final:.2f}\n")
-        report.write(f"Cumulative Return: {daily_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {daily_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {daily_drawdown:.2%}\n\n")
-
-        report.write(f"Weekly Performance:\n")
-        report.write(f"{'-'*20}\n")
-        report.write(f"Initial Portfolio Value: {weekly_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {weekly_final:.2f}\n")
-        report.write(f"Cumulative Return: {weekly_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {weekly_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {weekly_drawdown:.2%}\n\n")
-
-        report.write(f"Monthly Performance:\n")
-        report.write(f"{'-'*21}\n")
-        report.write(f"Initial Portfolio Value: {monthly_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {monthly_final:.2f}\n")
-        report.write(f"Cumulative Return: {monthly_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {monthly_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {monthly_drawdown:.2%}\n\n")
-
-        report.write(f"Yearly Performance:\n")
-        report.write(f"{'-'*20}\n")
-        report.write(f"Initial Portfolio Value: {yearly_initial:.2f}\n")
-        report.write(f"Final Portfolio Value: {yearly_final:.2f}\n")
-        report.write(f"Cumulative Return: {yearly_cum_return:.2%}\n")
-        report.write(f"Sharpe Ratio: {yearly_sharpe} (if applicable)\n")
-        report.write(f"Max Drawdown: {yearly_drawdown:.2%}\n\n")
-
-        report.write(f"Note: Sharpe Ratio is displayed as 'Insufficient data' when there are not enough data points to calculate a meaningful value or if returns are constant.\n\n")
-
-    # Ensure 'Cumulative Return' exists in the DataFrame for plotting
-    df['Daily Return'] = df['Portfolio Value'].pct_change()
-    df['Cumulative Return'] = (1 + df['Daily Return']).cumprod() - 1
-    generate_charts(df)
-
-
-
-def generate_charts(df):
-    plt.figure(figsize=(10, 6))
-    df['Cumulative Return'].plot()
-    plt.title('Cumulative Return')
-    plt.savefig('tests/logs/cumulative_return.png')
-    plt.close()
-
-    plt.figure(figsize=(10, 6))
-    df['Daily Return'].plot()
-    plt.title('Daily Return')
-    plt.savefig('tests/logs/daily_return.png')
-    plt.close()
-
-    df['Drawdown'] = df['Portfolio Value'] / df['Portfolio Value'].cummax() - 1
-    plt.figure(figsize=(10, 6))
-    df['Drawdown'].plot()
-    plt.title('Drawdown')
-    plt.savefig('tests/logs/drawdown.png')
-    plt.close()
+def generate_charts(series, background=False):
+    return render_charts(series, CHART_DIR, background=background)
 
 # Example usage
 if __name__ == "__main__":
@@ -1,31 +1,38 @@
 import csv
 import os
+import atexit
 from datetime import datetime
-import time
 import alpaca_trade_api as tradeapi
 import logging
+from trade_log import TradeLogWriter  # Shared writer from the project root
 # Path to the trade log file
 LOG_FILE = 'tests/logs/trade_log.csv'
 
+_sink = None  # Buffered file writer, opened on the first trade
+
+def close_trade_log():
+    global _sink
+    if _sink is not None:
+        _sink.close()
+        _sink = None
+
+atexit.register(close_trade_log)  # No buffered rows are lost on a clean exit
+
 def initialize_trade_log():
+    if _sink is not None:
+        _sink.flush()  # Rows from an earlier run go in before the file is checked
     if not os.path.exists(LOG_FILE):
         os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
         with open(LOG_FILE, mode='w', newline='') as file:
             writer = csv.writer(file)
             writer.writerow(['Timestamp', 'Symbol', 'Action', 'Quantity', 'Price', 'Status'])
 
-def wait_for_fill(api, order_id):
-    while True:
-        order = api.get_order(order_id)
-        if order.status == 'filled':
-            return order
-        time.sleep(1)  # Wait for 1 second before checking again
-
 def log_trade(order, action):
+    global _sink
     timestamp = datetime.now().isoformat()
     symbol = order['symbol']
     quantity = order['qty']
     price = order['price']
-    with open(LOG_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp, symbol, action, quantity, price])
+    if _sink is None:
+        _sink = TradeLogWriter(LOG_FILE, flush_rows=1000)  # Flushed on size, on a timer and at exit
+    _sink.write([timestamp, symbol, action, quantity, price])
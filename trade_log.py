@@ -1,11 +1,163 @@
 import csv
 import os
-from datetime import datetime
+import atexit
+import logging
+import threading
 import time
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
 import alpaca_trade_api as tradeapi
+from log_store import ColumnarLogStore, TRADE_LOG_SCHEMA
 
 # Path to the trade log file
 LOG_FILE = 'logs/trade_log.csv'
+TRADE_STORE_DIR = 'logs/trade_store'  # Columnar trade log (optional backend)
+TRADE_LOG_BACKEND = 'csv'  # 'csv' or 'columnar'
+
+# fsync policies for TradeLogWriter
+FSYNC_NEVER = 'never'        # Leave it to the OS
+FSYNC_ON_FLUSH = 'on_flush'  # fsync after every batch written
+FSYNC_ON_CLOSE = 'on_close'  # fsync once at shutdown
+
+class TradeLogWriter:
+    """Keeps the trade log open and writes rows in batches from a background thread.
+    Rows are buffered in memory and flushed when flush_rows are waiting, every flush_interval seconds and on close(),
+    so callers on the trading path only append to a list."""
+
+    def __init__(self, path, flush_rows=100, flush_interval=5.0, fsync_policy=FSYNC_NEVER):
+        self.path = path
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync_policy = fsync_policy
+        self.rows_written = 0
+        self._open()
+        self._buffer = []
+        self._cond = threading.Condition()  # Guards the buffer, held only for list operations
+        self._io_lock = threading.Lock()  # Held while a batch is written, fsynced or closed
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='trade-log-writer', daemon=True)
+        self._thread.start()
+
+    def _open(self):
+        self._file = open(self.path, mode='a', newline='')
+        self._writer = csv.writer(self._file)
+
+    def _write_rows(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+        if self.fsync_policy == FSYNC_ON_FLUSH:
+            os.fsync(self._file.fileno())
+
+    def _close_output(self):
+        if self.fsync_policy != FSYNC_NEVER:
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def write(self, row):
+        with self._cond:
+            if self._closed:
+                raise ValueError(f"Trade log writer for {self.path} is closed")
+            self._buffer.append(row)
+            if len(self._buffer) >= self.flush_rows:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._buffer) >= self.flush_rows, timeout=self.flush_interval)
+                closed = self._closed
+            self._flush()
+            if closed:
+                return
+
+    def _flush(self):
+        """ Writes out everything buffered. Only swapping the buffer out happens under the lock write() uses;
+        the disk I/O runs under a separate lock that keeps batches in order, so write() never waits on it."""
+        with self._io_lock:
+            with self._cond:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            self._write_rows(rows)
+            self.rows_written += len(rows)
+
+    def flush(self):
+        self._flush()
+
+    def close(self):
+        # Writes any remaining rows and closes the file, safe to call more than once
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._flush()
+        with self._io_lock:
+            self._close_output()
+
+class ColumnarTradeLogWriter(TradeLogWriter):
+    """TradeLogWriter that appends batches to a ColumnarLogStore (date-partitioned, indexed by symbol) instead of the CSV.
+    Enable with set_trade_log_sink(ColumnarTradeLogWriter())."""
+
+    def __init__(self, root=TRADE_STORE_DIR, flush_rows=100, flush_interval=5.0):
+        self.store = ColumnarLogStore(root, TRADE_LOG_SCHEMA, symbol_column='Symbol')
+        super().__init__(root, flush_rows, flush_interval)
+
+    def _open(self):
+        pass
+
+    def _write_rows(self, rows):
+        self.store.append(rows)  # Each chunk file is complete before the index points at it
+
+    def _close_output(self):
+        pass
+
+class MemoryTradeLog:
+    """In-memory trade log sink with the same write/flush/close interface, for backtests and sweeps that need no disk I/O."""
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+_sink = None  # Where log_trade sends rows, opened on first use
+_sink_lock = threading.Lock()
+
+def get_trade_log_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = ColumnarTradeLogWriter() if TRADE_LOG_BACKEND == 'columnar' else TradeLogWriter(LOG_FILE)
+        return _sink
+
+def set_trade_log_sink(sink):
+    # Replaces the trade log sink (e.g. with MemoryTradeLog()), closing the previous one
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+        _sink = sink
+    return sink
+
+def close_trade_log():
+    # Flushes and closes the trade log, registered to run at exit so no rows are lost
+    global _sink
+    with _sink_lock:
+        if _sink is not None:
+            _sink.close()
+            _sink = None
+
+atexit.register(close_trade_log)
 
 def initialize_trade_log():
     # Trade log CSV file. Creates the file and writes the header if it doesn't already exist.
@@ -15,23 +167,119 @@ def initialize_trade_log():
             writer = csv.writer(file)
             writer.writerow(['Timestamp', 'Symbol', 'Action', 'Quantity', 'Price', 'Order ID', 'Status']) # Headers
 
-def wait_for_fill(api, order_id): # Removed
-    # Continuously checks the status of an order until it is filled.
-    while True:
-        order = api.get_order(order_id)  # Fetch the current status of the order
-        if order.status == 'filled':
-            return order  # Return the order if it is filled
-        time.sleep(1)  # Wait for 1 second before checking again
+# Trade-update events that end an order's life
+TERMINAL_EVENTS = {'fill', 'canceled', 'expired', 'rejected', 'done_for_day'}
+# Final order statuses from get_order -> the trade-update event that reports them
+TERMINAL_STATUSES = {'filled': 'fill', 'canceled': 'canceled', 'expired': 'expired', 'rejected': 'rejected', 'done_for_day': 'done_for_day'}
+
+class OrderTracker:
+    """Tracks order state from the broker's trade-updates stream instead of polling get_order.
+    track(order_id) returns a concurrent.futures.Future that resolves with the final order (filled, canceled, ...),
+    partial fills update the order in between, and every finished order that filled is written to the trade log with its real fill price.
+    Events can come from Stream.subscribe_trade_updates or from a fake stream in tests. Orders whose final event never
+    arrives (e.g. across a stream reconnect) are resolved from get_order by reconcile()."""
+
+    def __init__(self, log_fills=True, keep_finished=1000, stale_after=60):
+        self.log_fills = log_fills
+        self.keep_finished = keep_finished  # Finished orders remembered for late track() calls
+        self.stale_after = stale_after  # Seconds an order is waited on before reconcile() asks the broker about it
+        self.orders = {}  # order id -> latest order entity
+        self._futures = {}  # order id -> Future
+        self._tracked_since = {}  # order id -> time.monotonic() when track() started waiting
+        self._finished = OrderedDict()  # order id -> final order entity
+        self._listeners = []  # Other trade-update handlers (e.g. the portfolio mirror)
+        self._lock = threading.Lock()
+
+    def add_listener(self, handler):
+        # Also forwards every trade update to handler, the stream only takes one trade-updates handler
+        self._listeners.append(handler)
+
+    def track(self, order_id):
+        """ Returns a Future for the order's final state. If the order already finished (its events can arrive
+        before submit_order returns), the Future is resolved straight away."""
+        with self._lock:
+            if order_id in self._finished:
+                # Nothing left to wait for, so the Future isn't kept in _futures
+                future = Future()
+                future.set_result(self._finished[order_id])
+                return future
+            future = self._futures.get(order_id)
+            if future is None:
+                future = self._futures[order_id] = Future()
+                self._tracked_since[order_id] = time.monotonic()
+            return future
+
+    def wait_for_fill(self, order_id, timeout=None):
+        # Blocks until the order finishes and returns it, raises TimeoutError after timeout seconds
+        return self.track(order_id).result(timeout)
+
+    def handle_event(self, event, order):
+        # Applies one trade update; order is the update's order dict
+        order = tradeapi.entity.Order(order)
+        finished = event in TERMINAL_EVENTS
+        with self._lock:
+            if order.id in self._finished:
+                return  # Already resolved, e.g. by reconcile() before the stream event arrived
+            self.orders[order.id] = order
+            future = None
+            if finished:
+                self.orders.pop(order.id, None)
+                self._finished[order.id] = order
+                while len(self._finished) > self.keep_finished:
+                    self._finished.popitem(last=False)
+                future = self._futures.pop(order.id, None)
+                self._tracked_since.pop(order.id, None)
+        if finished:
+            if self.log_fills:
+                if float(order.filled_qty or 0) > 0:
+                    log_trade(order, order.side)
+                else:
+                    logging.info(f"Order {order.id} for {order.symbol} ended ({event}) with nothing filled, not logged as a trade")
+            if future is not None and not future.done():
+                future.set_result(order)
+
+    def reconcile(self, api):
+        """ Asks the broker (get_order) about orders waited on for more than stale_after seconds and resolves the finished
+        ones as if their trade update had arrived. Returns the number of orders resolved."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [order_id for order_id, since in self._tracked_since.items() if now - since > self.stale_after]
+        resolved = 0
+        for order_id in stale:
+            try:
+                order = api.get_order(order_id)
+            except Exception as e:
+                logging.error(f"Error reconciling order {order_id}: {e}")
+                continue
+            if order.status in TERMINAL_STATUSES:
+                logging.info(f"Order {order_id} {order.status} without a trade update, resolved from get_order")
+                self.handle_event(TERMINAL_STATUSES[order.status], order._raw)
+                resolved += 1
+        return resolved
+
+    async def run_reconciler(self, api, interval):
+        # Calls reconcile() every interval seconds; the REST calls run on a worker thread, the event loop never waits on them
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(interval)
+            await loop.run_in_executor(None, self.reconcile, api)
+
+    async def on_trade_update(self, data):
+        # Handler for Stream.subscribe_trade_updates
+        try:
+            self.handle_event(data.event, data.order)
+        except Exception as e:
+            logging.error(f"Error tracking trade update: {e}")
+        for listener in self._listeners:
+            await listener(data)
 
 def log_trade(order, action):
-    # Logs the details of a trade to the trade log CSV file.
+    # Logs the details of a trade to the trade log (CSV file by default, see set_trade_log_sink).
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S') # Current timestamp
     symbol = order.symbol
-    qty = order.qty
-    price = order.filled_avg_price  # Filled average price
+    qty = order.filled_qty  # Quantity actually filled, less than order.qty for a partial fill that was then canceled or expired
+    price = order.filled_avg_price  # Filled average price (set once the order has filled, see OrderTracker)
     order_id = order.id
     status = order.status
 
-    with open(LOG_FILE, mode='a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow([timestamp, symbol, action, qty, price, order_id, status]) # Log trade details
+    get_trade_log_sink().write([timestamp, symbol, action, qty, price, order_id, status]) # Buffered, written by the background writer